@@ -8,10 +8,412 @@
 # 导入需要的工具包（就像打开工具箱）
 import os  # 操作系统工具，用来处理文件和文件夹
 import pickle  # 腌制工具，用来保存和读取数据（pickle在英语里是腌菜的意思）
+import pickletools  # pickle 辅助工具，用来去掉保存时多余的指令，让文件更小
+import json  # JSON 工具，.npy 格式的数据库用它保存名字列表
 import argparse  # 参数解析器，用来处理命令行输入
+import queue  # 队列，读图线程和主线程之间传递图片
+import threading  # 线程，导入时一边读图一边提取特征
+from collections import OrderedDict  # 有顺序的字典，用来实现“最久没用的先删掉”的缓存
+from concurrent.futures import ProcessPoolExecutor  # 进程池，用多个CPU核心同时处理照片
 import face_recognition  # 人脸识别工具，用来识别和分析人脸
+from face_recognition import api as face_recognition_api  # 里面有已经加载好的 dlib 模型
+import dlib  # face_recognition 底层的 dlib，用来判断是否编译了 CUDA 支持
 import cv2  # OpenCV图像处理库，用来读取和处理图片
-from pathlib import Path  # 路径工具，用来处理文件路径
+import numpy as np  # NumPy - 数学计算工具，用一整块矩阵存放所有人脸特征
+from model_export import BACKENDS, load_yolo_model  # YOLO 模型加载（可选导出推理引擎）
+try:
+    import faiss  # 可选：向量检索库，数据库很大时用近似最近邻索引加速查找
+except Exception:
+    faiss = None
+
+
+# 每张人脸特征编码的维度（face_recognition/dlib 固定输出128维）
+ENCODING_DIM = 128
+
+# 支持导入的图片后缀（小写，用集合查找比列表更快）
+IMAGE_SUFFIXES = frozenset({'.jpg', '.jpeg', '.png', '.bmp', '.webp'})
+
+# HNSW 索引中每个节点的邻居数量和搜索宽度（越大越准，但越慢）
+HNSW_NEIGHBORS = 32
+HNSW_EF_SEARCH = 64
+
+# 批量处理时每批图片的数量（dlib CNN 检测在 GPU 上的常用批大小）
+BATCH_SIZE = 16
+
+# 特征缓存最多记住多少张照片（超过后删掉最久没用到的）
+ENCODING_CACHE_SIZE = 100000
+
+# 追加日志里最多积累多少张脸，超过后把日志合并进数据库文件
+WAL_MAX_ROWS = 4096
+
+# 导入时读图线程最多提前读好几批图片（太多会占用大量内存）
+PREFETCH_BATCHES = 2
+
+# dlib 是否带 CUDA 编译：只有这种情况下成批检测才有意义
+DLIB_USE_CUDA = bool(getattr(dlib, 'DLIB_USE_CUDA', False))
+
+# 人脸检测模型：'cnn' 更准，在GPU上也更快；'hog' 适合只有CPU的电脑
+# 'yolo' 使用专门检测人脸的 YOLO 模型（如 yolov8n-face.pt），可导出 TensorRT 引擎加速
+DEFAULT_DETECTION_MODEL = 'cnn' if DLIB_USE_CUDA else 'hog'
+DETECTION_MODELS = ('hog', 'cnn', 'yolo')
+
+
+def _as_encoding_matrix(encodings):
+    """
+    把人脸特征（列表或数组）整理成一块连续的 (N, 128) float32 矩阵
+    旧版数据库里存的是“一堆小数组组成的列表”，这里统一转换
+    """
+    if encodings is None or len(encodings) == 0:
+        return np.empty((0, ENCODING_DIM), dtype=np.float32)
+    matrix = np.asarray(encodings, dtype=np.float32)
+    return np.ascontiguousarray(matrix.reshape(-1, ENCODING_DIM))
+
+
+def normalize_encodings(encodings):
+    """
+    【特征归一化】
+    把每一行特征缩放成长度为1的单位向量，同时记下原来的长度
+    数据库里存单位向量后，和所有人脸的比对只需要一次矩阵乘向量；
+    记下的长度用来还原原始的欧氏距离，0.6 的判定阈值因此保持不变
+
+    返回值：
+        (单位向量矩阵, 每行原来的长度)
+    """
+    matrix = _as_encoding_matrix(encodings)
+    norms = np.linalg.norm(matrix, axis=1).astype(np.float32)
+    unit = matrix / (norms[:, None] + 1e-12)
+    return np.ascontiguousarray(unit, dtype=np.float32), norms
+
+
+def quantize_encodings(unit_encodings):
+    """
+    【特征压缩为 int8】
+    单位向量的每个分量都在 [-1, 1] 之间，可以压缩成 int8 保存，只占 float32 的四分之一
+    每一行按自己的最大绝对值缩放到 [-127, 127]，精度比整块矩阵共用一个比例更高
+    """
+    unit = _as_encoding_matrix(unit_encodings)
+    peaks = np.abs(unit).max(axis=1, keepdims=True)
+    return np.round(unit * (127.0 / (peaks + 1e-12))).astype(np.int8)
+
+
+def dequantize_encodings(quantized):
+    """
+    【int8 特征还原】
+    压缩时每行的缩放比例不用单独保存：还原成 float32 后重新归一化即可得到单位向量
+    """
+    unit, _ = normalize_encodings(np.asarray(quantized, dtype=np.float32))
+    return unit
+
+
+def names_path_for(npy_path):
+    """.npy 格式数据库的名字列表文件路径：face_database.npy -> face_database.names.json"""
+    return os.path.splitext(npy_path)[0] + '.names.json'
+
+
+def index_path_for(db_path):
+    """faiss 索引文件路径：face_database.pkl -> face_database.pkl.faiss"""
+    return db_path + '.faiss'
+
+
+def cache_path_for(db_path):
+    """特征缓存文件路径：face_database.pkl -> face_database.pkl.cache"""
+    return db_path + '.cache'
+
+
+def wal_path_for(db_path):
+    """追加日志文件路径：face_database.pkl -> face_database.pkl.wal"""
+    return db_path + '.wal'
+
+
+def norms_path_for(npy_path):
+    """.npy 格式数据库的特征长度文件路径：face_database.npy -> face_database.norms.npy"""
+    return os.path.splitext(npy_path)[0] + '.norms.npy'
+
+
+def needs_upgrade(db_path):
+    """
+    判断 pickle 数据库是否是用旧协议保存的（只看文件开头两个字节，不用整个读一遍）
+    旧协议会把 numpy 矩阵拆成很多小对象，读取又慢又占内存，需要重新保存一次
+    """
+    if db_path.endswith(('.npy', '.npz')) or not os.path.exists(db_path):
+        return False
+    with open(db_path, 'rb') as f:
+        header = f.read(2)
+    # 协议 2 及以上的文件以 0x80 加协议号开头；更老的协议没有这个开头
+    return len(header) < 2 or header[0] != 0x80 or header[1] < pickle.HIGHEST_PROTOCOL
+
+
+def _write_file_atomic(path, write):
+    """
+    先写到临时文件并确保真正落盘（fsync），再整体替换原文件
+    写到一半断电或出错时，原文件保持完整，不会留下写了一半的数据库
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def append_wal(db_path, wal_token, encodings, names):
+    """
+    【把新添加的人脸追加到日志】
+    只把新增的几行写到数据库旁边的 .wal 文件末尾，不用把整个数据库重写一遍
+    日志开头记录了它属于哪一版数据库文件（wal_token），数据库整体重写后旧日志自动作废
+
+    参数说明：
+        encodings: 新增的原始特征（没有归一化的）
+        names: 对应的名字
+    """
+    wal_path = wal_path_for(db_path)
+    with open(wal_path, 'ab') as f:
+        if f.tell() == 0:
+            pickle.dump({'wal_token': wal_token}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump((list(names), _as_encoding_matrix(encodings)), f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _replay_wal(db_path, wal_token):
+    """
+    读取属于这一版数据库文件的追加日志
+    返回 (原始特征列表, 名字列表, 日志是否完整)；
+    最后一条记录没写完（比如写的时候断电）时，读到那里为止
+    """
+    wal_path = wal_path_for(db_path)
+    encodings, names = [], []
+    if wal_token is None or not os.path.exists(wal_path):
+        return encodings, names, True
+    with open(wal_path, 'rb') as f:
+        try:
+            header = pickle.load(f)
+        except Exception:
+            return encodings, names, False
+        if header.get('wal_token') != wal_token:
+            return encodings, names, True  # 旧日志，内容已经合并进数据库文件了
+        while True:
+            try:
+                record_names, record_encodings = pickle.load(f)
+            except EOFError:
+                return encodings, names, True
+            except Exception:
+                return encodings, names, False
+            encodings.append(record_encodings)
+            names.extend(record_names)
+
+
+def read_database_file(db_path):
+    """
+    【读取数据库文件】
+    根据后缀名选择格式：
+        .npy —— 特征矩阵用内存映射打开（不整体读入内存，用到哪一行才从磁盘读哪一行），
+                名字保存在旁边的 .names.json 里，特征长度保存在 .norms.npy 里
+        .npz —— 一个文件里分别存特征矩阵、特征长度和名字数组（都是整块的 numpy 数组，
+                读取时不用逐个还原 Python 对象，也不需要 pickle）
+        其他 —— pickle 格式（旧版默认格式）
+    特征以单位向量保存；旧版数据库里没有归一化的特征会在读取时补做归一化，
+    以 int8 压缩保存的特征会在读取时还原为 float32
+
+    pickle 格式的数据库旁边如果有追加日志（.wal），日志里的人脸也会一起读出来
+
+    返回值：
+        (单位向量特征矩阵, 每行特征原来的长度, 名字列表)
+    """
+    encodings, norms, names, _, _ = _read_database(db_path)
+    return encodings, norms, names
+
+
+def _read_database(db_path):
+    """
+    read_database_file 的完整版本
+    返回 (单位向量特征矩阵, 特征长度, 名字列表, 数据库版本标记 wal_token, 从日志读到的行数)
+    """
+    norms = None
+    wal_token = None
+    if db_path.endswith('.npz'):
+        with np.load(db_path) as data:
+            encodings = data['encodings']
+            names = data['names'].tolist()
+            if 'norms' in data.files:
+                norms = data['norms']
+            if 'wal_token' in data.files:
+                wal_token = str(data['wal_token']) or None
+    elif db_path.endswith('.npy'):
+        encodings = np.load(db_path, mmap_mode='r')
+        with open(names_path_for(db_path), 'r', encoding='utf-8') as f:
+            names = json.load(f)
+        if os.path.exists(norms_path_for(db_path)):
+            norms = np.load(norms_path_for(db_path))
+    else:
+        with open(db_path, 'rb') as f:
+            data = pickle.load(f)
+        encodings = data.get('encodings')
+        names = data.get('names', [])
+        norms = data.get('norms')
+        wal_token = data.get('wal_token')
+
+    if norms is None:
+        # 旧版数据库：存的是原始特征，补做归一化
+        encodings, norms = normalize_encodings(encodings)
+    elif getattr(encodings, 'dtype', None) == np.int8:
+        # int8 压缩保存的特征
+        encodings = dequantize_encodings(encodings)
+        norms = np.asarray(norms, dtype=np.float32).reshape(-1)
+    else:
+        encodings = _as_encoding_matrix(encodings)
+        norms = np.asarray(norms, dtype=np.float32).reshape(-1)
+    names = list(names)
+    if not len(names) == len(encodings) == len(norms):
+        raise ValueError(f"特征数量（{len(encodings)}）与名字数量（{len(names)}）不一致")
+
+    # 把追加日志里的人脸接到后面
+    wal_encodings, wal_names, wal_complete = _replay_wal(db_path, wal_token)
+    if wal_names:
+        wal_unit, wal_norms = normalize_encodings(np.vstack(wal_encodings))
+        encodings = np.vstack([encodings, wal_unit])
+        norms = np.concatenate([norms, wal_norms])
+        names.extend(wal_names)
+    wal_rows = len(wal_names) if wal_complete else None  # None 表示日志末尾损坏
+    return encodings, norms, names, wal_token, wal_rows
+
+
+def write_database_file(db_path, encodings, norms, names, quantize=False, wal_token=None):
+    """
+    【写入数据库文件】
+    格式由后缀名决定（见 read_database_file）；encodings 必须是单位向量
+    quantize=True 时特征以 int8 压缩保存（文件和读取量都缩小为四分之一）
+    wal_token: pickle / .npz 格式时记录的数据库版本标记，只有标记相同的追加日志才会被读取
+    所有文件都先写临时文件再整体替换，写到一半出错也不会损坏原来的数据库
+    """
+    encodings = quantize_encodings(encodings) if quantize else _as_encoding_matrix(encodings)
+    if db_path.endswith('.npy'):
+        names_path = names_path_for(db_path)
+        norms_path = norms_path_for(db_path)
+        names_json = json.dumps(list(names), ensure_ascii=False).encode('utf-8')
+        _write_file_atomic(names_path, lambda f: f.write(names_json))
+        _write_file_atomic(norms_path, lambda f: np.save(f, np.asarray(norms, dtype=np.float32)))
+        _write_file_atomic(db_path, lambda f: np.save(f, encodings))
+    elif db_path.endswith('.npz'):
+        # 不压缩：读取时每个数组都是一次整块读入
+        arrays = {
+            'encodings': encodings,
+            'norms': np.asarray(norms, dtype=np.float32),
+            'names': np.asarray(list(names), dtype=str),
+            'wal_token': np.asarray(wal_token or ''),
+        }
+        _write_file_atomic(db_path, lambda f: np.savez(f, **arrays))
+    else:
+        # 把数据整理成一个字典（就像一个有标签的盒子）
+        data = {
+            'encodings': encodings,  # 人脸特征数据（单位向量）
+            'norms': np.asarray(norms, dtype=np.float32),  # 每个特征原来的长度
+            'names': list(names),  # 人脸名字
+            'wal_token': wal_token  # 数据库版本标记（用来认领追加日志）
+        }
+        # 使用最高协议：numpy 矩阵会按原始内存整块写入，而不是逐个元素序列化
+        # pickletools.optimize 去掉没用到的 memo 指令（名字很多时文件明显变小）
+        payload = pickletools.optimize(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+        _write_file_atomic(db_path, lambda f: f.write(payload))
+
+
+def encode_faces(images, face_locations):
+    """
+    【一次性提取多张图片里所有人脸的特征】
+    直接调用 dlib 的批量接口：一次 C++ 调用算出所有图片里所有脸的特征，
+    不用每张脸都在 Python 和 C++ 之间来回一趟
+    （face_recognition.face_encodings 内部是一张脸调用一次）
+
+    参数说明：
+        images: RGB 图片列表
+        face_locations: 每张图片里要提取的人脸位置列表 [(上, 右, 下, 左), ...]
+
+    返回值：
+        每张图片一个列表，里面是这张图片里每张脸的128维特征
+    """
+    encodings = [[] for _ in images]
+    batch_images, batch_faces, owners = [], [], []
+    for i, (image, locations) in enumerate(zip(images, face_locations)):
+        if not locations:
+            continue
+        # 用5点关键点模型（和 face_recognition.face_encodings 默认的一样）对齐人脸
+        shapes = dlib.full_object_detections()
+        for top, right, bottom, left in locations:
+            shapes.append(face_recognition_api.pose_predictor_5_point(
+                image, dlib.rectangle(left, top, right, bottom)))
+        batch_images.append(image)
+        batch_faces.append(shapes)
+        owners.append(i)
+    if batch_images:
+        descriptors = face_recognition_api.face_encoder.compute_face_descriptor(batch_images, batch_faces, 1)
+        for i, faces in zip(owners, descriptors):
+            encodings[i] = [np.array(face) for face in faces]
+    return encodings
+
+
+def encode_first_faces(images, locations):
+    """
+    【一次性提取多张图片的人脸特征】
+    每张图片只提取一张脸（见 encode_faces）
+
+    参数说明：
+        images: RGB 图片列表
+        locations: 每张图片里要提取的那张脸的位置 (上, 右, 下, 左)
+
+    返回值：
+        每张图片对应的128维特征列表
+    """
+    return [faces[0] for faces in encode_faces(images, [[location] for location in locations])]
+
+
+def load_rgb_image(image_path, reduced=False):
+    """
+    【读取图片为 RGB 数组】
+    用 OpenCV 解码图片（np.fromfile 读取，中文路径也没问题）
+    reduced=True 时以一半分辨率解码：JPEG 可以在解码阶段直接缩小，
+    省掉大部分解码计算；提取人脸特征只需要 150×150 的人脸小图，足够用了
+    """
+    data = np.fromfile(image_path, dtype=np.uint8)
+    flags = cv2.IMREAD_REDUCED_COLOR_2 if reduced else cv2.IMREAD_COLOR
+    image = cv2.imdecode(data, flags)
+    if image is None:
+        raise ValueError("无法解码图片")
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def _encode_image(image_path, name, detection_model='hog'):
+    """
+    【子进程任务：提取一张图片的人脸特征】
+    放在模块最外层，是为了能交给进程池里的其他进程执行
+    子进程里不直接打印，而是把提示信息带回主进程统一输出
+
+    返回值：
+        (特征编码或None, 提示信息列表)
+    """
+    messages = []
+    try:
+        # 先用一半分辨率快速解码；找不到脸（比如脸太小）再用原图重试
+        image = load_rgb_image(image_path, reduced=True)
+        face_locations = face_recognition.face_locations(image, model=detection_model)
+        if len(face_locations) == 0:
+            image = load_rgb_image(image_path)
+            face_locations = face_recognition.face_locations(image, model=detection_model)
+        if len(face_locations) == 0:
+            return None, [f"✗ 在图片中没有检测到人脸：{image_path}"]
+        if len(face_locations) > 1:
+            messages.append(f"⚠ 图片中检测到多张人脸：{image_path}，将使用第一张脸")
+
+        face_encodings = face_recognition.face_encodings(
+            image, known_face_locations=face_locations[:1]
+        )
+        if len(face_encodings) == 0:
+            return None, messages + [f"✗ 在图片中没有检测到人脸：{image_path}"]
+
+        messages.append(f"✓ 成功添加了 '{name}' 的人脸，来自 {image_path}")
+        return np.asarray(face_encodings[0], dtype=np.float32), messages
+    except Exception as e:
+        return None, messages + [f"✗ 处理图片时出错：{image_path}：{e}"]
 
 
 class FaceDatabase:
@@ -21,18 +423,67 @@ class FaceDatabase:
     可以添加人脸、保存人脸、查看人脸等功能
     """
     
-    def __init__(self, db_path='face_database.pkl'):
+    def __init__(self, db_path='face_database.pkl', detection_model=None,
+                 yolo_model='yolov8n-face.pt', backend='torch', yolo_confidence=0.5,
+                 quantize=False, warmup=None, int8_data=None):
         """
         【初始化函数 - 创建数据库对象】
         当创建一个新的人脸数据库时，这个函数会被自动调用
         
         参数说明：
             db_path: 数据库文件保存的位置（默认是'face_database.pkl'）
+            detection_model: 人脸检测模型 'hog'、'cnn' 或 'yolo'
+                             （默认自动：有CUDA用'cnn'，否则用'hog'）
+            yolo_model: 检测模型为 'yolo' 时使用的人脸检测权重（需要是专门检测人脸的模型）
+            backend: YOLO 推理后端 'torch'、'trt' 或 'openvino'
+                     （'trt'/'openvino' 会导出并缓存推理引擎；'openvino' 适合只有CPU的电脑）
+            yolo_confidence: YOLO 人脸检测的信心阈值
+            quantize: 保存时是否把特征压缩为 int8（文件缩小为四分之一，适合很大的数据库）
+            warmup: 是否提前预热人脸特征模型（默认看环境变量 FACEDB_WARMUP，不设置时预热）
+                    只查看或清空数据库时不需要预热，可以传 False
+            int8_data: INT8 校准用的数据集 yaml（人脸画面）；给出时 'trt'/'openvino' 导出 INT8 引擎，
+                       不给时导出 FP16 引擎（见 model_export）
         """
+        if detection_model is not None and detection_model not in DETECTION_MODELS:
+            raise ValueError(f"detection_model must be one of {DETECTION_MODELS}")
         self.db_path = db_path  # 保存数据库文件的路径
-        self.face_encodings = []  # 存放所有人脸特征的列表（空列表，等待添加）
+        self.detection_model = detection_model or DEFAULT_DETECTION_MODEL  # 人脸检测模型
+        self.yolo_model_path = yolo_model  # YOLO 人脸检测权重
+        self.backend = backend  # YOLO 推理后端
+        self.yolo_confidence = yolo_confidence  # YOLO 检测信心阈值
+        self.int8_data = int8_data  # INT8 校准数据集
+        self._yolo = None  # YOLO 检测器，第一次用到时才加载
+        self.quantize = quantize  # 保存时是否压缩为 int8
+        self._index = None  # faiss 向量索引，第一次搜索时才建立
+        # 存放所有人脸特征的矩阵（每一行是一张脸归一化后的单位向量，形状为 N×128，float32）
+        self.face_encodings = _as_encoding_matrix(None)
+        # 每张脸特征原来的长度（和单位向量一起可以还原原始特征）
+        self.face_norms = np.empty(0, dtype=np.float32)
         self.face_names = []  # 存放所有人脸名字的列表
+        self._dirty = False  # 内存中的数据是否有还没保存到文件的改动
+        self._encoding_cache = None  # 照片特征缓存，第一次用到时才从文件读取
+        self._wal_token = None  # 磁盘上数据库文件的版本标记（pickle 和 .npz 格式才有）
+        self._wal_rows = 0  # 追加日志里已经有多少张脸
+        self._saved_rows = None  # 磁盘上已经有前多少张脸；None 表示需要整体重写
         self.load_database()  # 尝试加载已有的数据库
+        if warmup is None:
+            warmup = os.environ.get('FACEDB_WARMUP', '1') == '1'
+        if warmup:
+            self._warmup()
+
+    def _warmup(self):
+        """
+        【预热模型】
+        第一次计算人脸特征时 dlib 要加载模型权重（用 CUDA 时还要初始化显卡），会卡一两秒
+        先用一张全黑的小图片算一次，之后添加第一张真实照片时就不会卡顿了
+        """
+        dummy = np.zeros((160, 160, 3), dtype=np.uint8)
+        try:
+            if self.detection_model == 'cnn':
+                face_recognition.face_locations(dummy, model='cnn')
+            face_recognition.face_encodings(dummy, known_face_locations=[(0, 160, 160, 0)])
+        except Exception as e:
+            print(f"预热模型失败（不影响使用）：{e}")
     
     def load_database(self):
         """
@@ -43,44 +494,99 @@ class FaceDatabase:
         # 检查数据库文件是否存在
         if os.path.exists(self.db_path):
             try:
-                # 打开文件并读取数据
-                with open(self.db_path, 'rb') as f:  # 'rb'表示以二进制读取模式打开
-                    data = pickle.load(f)  # 从文件中读取数据
-                    # 获取人脸特征编码（就像每个人独特的"身份证"）
-                    self.face_encodings = data.get('encodings', [])
-                    # 获取人脸对应的名字
-                    self.face_names = data.get('names', [])
+                # 从文件中读取人脸特征编码（就像每个人独特的"身份证"）和对应的名字
+                # 特征统一是一整块 float32 矩阵，方便后续向量化比对
+                # （.npy 格式是只读的内存映射，添加人脸时会生成新的矩阵，不会改动原文件）
+                (self.face_encodings, self.face_norms, self.face_names,
+                 self._wal_token, wal_rows) = _read_database(self.db_path)
+                self._index = None  # 数据变了，索引需要重新建立
+                self._saved_rows = len(self.face_names)
+                self._wal_rows = wal_rows or 0
                 print(f"✓ 成功加载了 {len(self.face_names)} 张人脸数据")
+                # 旧版数据库只需升级一次：按新格式重新保存，以后读取就快了
+                if needs_upgrade(self.db_path):
+                    print("检测到旧版数据库格式，正在升级...")
+                    self._saved_rows = None
+                    self.save_database(force=True)
+                elif wal_rows is None or self._wal_rows > WAL_MAX_ROWS:
+                    # 日志末尾损坏（写的时候断电）或日志太长：合并进数据库文件，重新开始记日志
+                    self._saved_rows = None
+                    self.save_database(force=True)
             except Exception as e:
                 # 如果出错了，打印错误信息
                 print(f"加载数据库时出错了：{e}")
-                # 重新创建空列表
-                self.face_encodings = []
+                # 重新创建空数据
+                self.face_encodings = _as_encoding_matrix(None)
+                self.face_norms = np.empty(0, dtype=np.float32)
                 self.face_names = []
         else:
             # 如果文件不存在，说明是第一次使用
             print("没有找到现有的数据库，正在创建新数据库。")
     
-    def save_database(self):
+    def save_database(self, force=False):
         """
         【保存数据库】
         把人脸数据保存到文件中
         就像把相册整理好，放到书架上保存
+        数据没有改动时直接跳过（连续添加很多张脸时，只在最后写一次文件）
+        只是新添加了人脸时，只把新增的几行追加到日志文件（.wal），不用重写整个数据库；
+        日志积累到 WAL_MAX_ROWS 张脸、或者清空过数据库时，才整体重写一次
+        整体重写时先写临时文件再替换，写到一半断电也不会损坏原来的数据库
+
+        参数说明：
+            force: 没有改动也强制重新写一次文件
         """
-        # 把数据整理成一个字典（就像一个有标签的盒子）
-        data = {
-            'encodings': self.face_encodings,  # 人脸特征数据
-            'names': self.face_names  # 人脸名字
-        }
+        if not self._dirty and not force:
+            return True
         try:
-            # 打开文件并写入数据
-            with open(self.db_path, 'wb') as f:  # 'wb'表示以二进制写入模式打开
-                pickle.dump(data, f)  # 把数据保存到文件
+            new_rows = len(self.face_names) - (self._saved_rows or 0)
+            if (not force and self._saved_rows is not None and self._wal_token is not None
+                    and self._wal_rows + new_rows <= WAL_MAX_ROWS):
+                # 只追加新增的人脸（日志里存原始特征，读取时再归一化）
+                start = self._saved_rows
+                append_wal(self.db_path, self._wal_token,
+                           self.face_encodings[start:] * self.face_norms[start:, None],
+                           self.face_names[start:])
+                self._wal_rows += new_rows
+            else:
+                # 整体重写数据库文件（格式由文件后缀名决定），换一个新的版本标记让旧日志作废
+                wal_token = None if self.db_path.endswith('.npy') else os.urandom(8).hex()
+                write_database_file(self.db_path, self.face_encodings, self.face_norms,
+                                    self.face_names, quantize=self.quantize, wal_token=wal_token)
+                if os.path.exists(wal_path_for(self.db_path)):
+                    os.remove(wal_path_for(self.db_path))
+                self._wal_token = wal_token
+                self._wal_rows = 0
+            self._saved_rows = len(self.face_names)
+            # 索引也一起保存，下次搜索时直接读取，不用重新建立
+            if faiss is not None and self._index is not None:
+                faiss.write_index(self._index, index_path_for(self.db_path))
+            # 特征缓存也一起保存，下次导入同样的照片时不用重新提取特征
+            if self._encoding_cache is not None:
+                cache = self._encoding_cache
+                _write_file_atomic(cache_path_for(self.db_path), lambda f: pickle.dump(
+                    cache, f, protocol=pickle.HIGHEST_PROTOCOL))
+            self._dirty = False
             print(f"✓ 数据库保存成功！共有 {len(self.face_names)} 张人脸")
             return True
         except Exception as e:
             print(f"保存数据库时出错了：{e}")
             return False
+
+    def __enter__(self):
+        """
+        支持 with 语句：
+            with FaceDatabase('face_database.pkl') as db:
+                db.add_face_from_image('照片.jpg', '小明')
+        离开 with 时自动保存一次
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # 出错时不保存，避免把一半的数据写进文件
+        if exc_type is None:
+            self.save_database()
+        return False
     
     def add_face_from_image(self, image_path, name):
         """
@@ -95,43 +601,222 @@ class FaceDatabase:
         返回值：
             True 表示成功，False 表示失败
         """
-        # 检查图片文件是否存在
-        if not os.path.exists(image_path):
-            print(f"✗ 找不到图片：{image_path}")
-            return False
-        
+        return self.add_faces_batch([image_path], name) == 1
+
+    def add_faces_batch(self, image_paths, name):
+        """
+        【批量添加同一个人的人脸】
+        先把这个人的照片全部读进来，再一起检测人脸、提取特征
+        比一张一张处理少了很多来回切换，有GPU时还能成批检测
+
+        参数说明：
+            image_paths: 图片文件路径的列表
+            name: 这个人的名字
+
+        返回值：
+            成功添加的人脸数量
+        """
+        # 之前处理过的照片直接用缓存的特征
+        cached_count, image_paths = self._take_cached(image_paths, name)
+        # 先把剩下的图片读进内存，再一起处理
+        loaded_paths, images = self._load_images(image_paths)
+        return cached_count + self._add_loaded_images(loaded_paths, images, name)
+
+    def _cache_key(self, image_path):
+        """
+        照片的缓存键：(绝对路径, 修改时间, 文件大小)
+        照片被修改或替换后键就变了，会重新提取特征；文件读不到时返回 None
+        """
         try:
-            # 加载图片文件
-            image = face_recognition.load_image_file(image_path)
-            
-            # 在图片中寻找人脸的位置
-            # 就像在一张集体照中圈出每个人的脸
-            face_locations = face_recognition.face_locations(image)
-            
-            # 提取每个人脸的特征编码
-            # 就像给每张脸生成一个独特的"指纹"
-            face_encodings = face_recognition.face_encodings(image, face_locations)
-            
-            # 检查是否找到了人脸
-            if len(face_encodings) == 0:
-                print(f"✗ 在图片中没有检测到人脸：{image_path}")
-                return False
-            
-            # 如果图片中有多张脸，给出提示
-            if len(face_encodings) > 1:
-                print(f"⚠ 图片中检测到多张人脸：{image_path}，将使用第一张脸")
-            
-            # 把第一张脸的特征添加到数据库
-            self.face_encodings.append(face_encodings[0])
-            self.face_names.append(name)
-            print(f"✓ 成功添加了 '{name}' 的人脸，来自 {image_path}")
-            return True
-            
+            stat = os.stat(image_path)
+        except OSError:
+            return None
+        return (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size)
+
+    def _get_encoding_cache(self):
+        """取得特征缓存（第一次用到时从数据库旁边的缓存文件读取）"""
+        if self._encoding_cache is None:
+            self._encoding_cache = OrderedDict()
+            cache_path = cache_path_for(self.db_path)
+            if os.path.exists(cache_path):
+                try:
+                    with open(cache_path, 'rb') as f:
+                        self._encoding_cache = pickle.load(f)
+                except Exception as e:
+                    print(f"读取特征缓存失败，将重新提取特征：{e}")
+        return self._encoding_cache
+
+    def _take_cached(self, image_paths, name):
+        """
+        把缓存里已经有特征的照片直接加入数据库
+        返回 (直接加入的人脸数量, 还需要处理的图片路径列表)
+        """
+        cache = self._get_encoding_cache()
+        cached_rows = []
+        remaining = []
+        for image_path in image_paths:
+            key = self._cache_key(image_path)
+            if key is not None and key in cache:
+                cache.move_to_end(key)  # 刚用过，放到最后（最不容易被删掉）
+                cached_rows.append(cache[key])
+            else:
+                remaining.append(image_path)
+        self._append_encodings(cached_rows, [name] * len(cached_rows))
+        return len(cached_rows), remaining
+
+    def _cache_encoding(self, image_path, encoding):
+        """把新提取的特征记进缓存，超出容量时删掉最久没用到的"""
+        key = self._cache_key(image_path)
+        if key is None:
+            return
+        cache = self._get_encoding_cache()
+        cache[key] = np.asarray(encoding, dtype=np.float32)
+        cache.move_to_end(key)
+        while len(cache) > ENCODING_CACHE_SIZE:
+            cache.popitem(last=False)
+
+    def _load_images(self, image_paths):
+        """
+        以一半分辨率快速解码一批图片
+        返回 (读取成功的图片路径列表, 图片列表)
+        """
+        images = []
+        loaded_paths = []
+        for image_path in image_paths:
+            if not os.path.exists(image_path):
+                print(f"✗ 找不到图片：{image_path}")
+                continue
+            try:
+                images.append(load_rgb_image(image_path, reduced=True))
+                loaded_paths.append(image_path)
+            except Exception as e:
+                print(f"✗ 处理图片时出错：{image_path}：{e}")
+        return loaded_paths, images
+
+    def _add_loaded_images(self, loaded_paths, images, name):
+        """
+        对已经读进内存的一批图片检测人脸、提取特征并加入数据库
+        返回成功添加的人脸数量
+        """
+        if not images:
+            return 0
+
+        # 一次性找出所有图片中的人脸位置
+        all_locations = self._batch_face_locations(images)
+
+        # 缩小后找不到脸的图片（比如脸本来就很小），用原始分辨率再找一次
+        retry = [i for i, face_locations in enumerate(all_locations) if len(face_locations) == 0]
+        if retry:
+            for i in retry:
+                images[i] = load_rgb_image(loaded_paths[i])
+            retry_locations = self._batch_face_locations([images[i] for i in retry])
+            for i, face_locations in zip(retry, retry_locations):
+                all_locations[i] = face_locations
+
+        # 用数组统计每张图片里有几张脸，一次筛出有脸的图片（不在循环里逐张判断和打印）
+        counts = np.array([len(face_locations) for face_locations in all_locations], dtype=np.int32)
+        valid = np.flatnonzero(counts > 0)
+
+        try:
+            # 只对第一张脸提取特征（其他脸反正用不上），这一批所有人脸的特征一次算完
+            new_rows = encode_first_faces([images[i] for i in valid],
+                                          [all_locations[i][0] for i in valid])
         except Exception as e:
-            print(f"✗ 处理图片时出错：{image_path}：{e}")
-            return False
+            print(f"✗ 提取人脸特征时出错：{e}")
+            return 0
+
+        for i, row in zip(valid, new_rows):
+            self._cache_encoding(loaded_paths[i], row)
+
+        # 整批只打印一次结果汇总
+        summary = f"✓ '{name}'：成功添加 {len(valid)} 张人脸，跳过 {len(counts) - len(valid)} 张图片"
+        skipped = np.flatnonzero(counts == 0)
+        if len(skipped):
+            summary += "\n✗ 没有检测到人脸：" + "、".join(loaded_paths[i] for i in skipped)
+        multiple = np.flatnonzero(counts > 1)
+        if len(multiple):
+            summary += "\n⚠ 检测到多张人脸（已使用第一张脸）：" + "、".join(loaded_paths[i] for i in multiple)
+        print(summary)
+
+        # 新的特征一次性追加到特征矩阵（而不是每张脸拷贝一次整个矩阵）
+        self._append_encodings(new_rows, [name] * len(new_rows))
+        return len(new_rows)
+
+    def _append_encodings(self, encodings, names):
+        """
+        把新的人脸特征归一化后追加到数据库（一次性追加，只拷贝一次整个矩阵）
+        """
+        if len(encodings) == 0:
+            return
+        unit, norms = normalize_encodings(encodings)
+        self.face_encodings = np.vstack([self.face_encodings, unit])
+        self.face_norms = np.concatenate([self.face_norms, norms])
+        self.face_names.extend(names)
+        self._dirty = True
+        if self._index is not None:
+            self._index.add(unit)
+
+    def _batch_face_locations(self, images):
+        """
+        找出多张图片中的人脸位置，返回和 images 一一对应的位置列表
+        有 CUDA 且使用 CNN 模型时成批在GPU上检测，否则逐张检测
+        """
+        if self.detection_model == 'yolo':
+            return self._yolo_face_locations(images)
+
+        if not (DLIB_USE_CUDA and self.detection_model == 'cnn'):
+            return [
+                face_recognition.face_locations(image, model=self.detection_model)
+                for image in images
+            ]
+
+        # dlib 成批检测要求同一批图片尺寸相同，所以先按尺寸分组
+        all_locations = [None] * len(images)
+        groups = {}
+        for i, image in enumerate(images):
+            groups.setdefault(image.shape, []).append(i)
+
+        for indices in groups.values():
+            batch_locations = face_recognition.batch_face_locations(
+                [images[i] for i in indices],
+                number_of_times_to_upsample=1,
+                batch_size=BATCH_SIZE,
+            )
+            for i, face_locations in zip(indices, batch_locations):
+                all_locations[i] = face_locations
+        return all_locations
+
+    def _yolo_face_locations(self, images):
+        """
+        用 YOLO 人脸检测模型成批找出人脸位置
+        返回格式与 face_recognition 一致：(上, 右, 下, 左)，按信心值从高到低排列
+        """
+        if self._yolo is None:
+            print(f"正在加载YOLO人脸检测模型：{self.yolo_model_path}（后端：{self.backend}）")
+            self._yolo = load_yolo_model(
+                self.yolo_model_path, backend=self.backend,
+                int8=(self.backend != 'torch'), data=self.int8_data
+            )
+
+        # face_recognition 读入的是 RGB，YOLO 需要 BGR
+        bgr_images = [np.ascontiguousarray(image[:, :, ::-1]) for image in images]
+        results = self._yolo(bgr_images, conf=self.yolo_confidence, verbose=False)
+
+        all_locations = []
+        for image, result in zip(images, results):
+            height, width = image.shape[:2]
+            boxes = result.boxes
+            order = np.argsort(-boxes.conf.cpu().numpy())
+            xyxy = boxes.xyxy.cpu().numpy()[order].astype(np.int32)
+            xyxy[:, 0::2] = np.clip(xyxy[:, 0::2], 0, width)
+            xyxy[:, 1::2] = np.clip(xyxy[:, 1::2], 0, height)
+            all_locations.append([
+                (int(y1), int(x2), int(y2), int(x1)) for x1, y1, x2, y2 in xyxy
+                if x2 > x1 and y2 > y1
+            ])
+        return all_locations
     
-    def import_from_directory(self, directory_path):
+    def import_from_directory(self, directory_path, workers=None, progress=None):
         """
         【从文件夹批量导入人脸】
         从一个特殊结构的文件夹中批量导入人脸照片
@@ -146,32 +831,127 @@ class FaceDatabase:
         
         参数说明：
             directory_path: 包含人脸照片的文件夹路径
+            workers: 并行处理照片的进程数（默认：CPU核心数；1表示不并行）
+            progress: 可选的进度回调 progress(已处理张数, 总张数)，每处理完一批（或一张）照片调用一次
+                      （在调用 import_from_directory 的线程里调用）
         """
         # 检查文件夹是否存在
         if not os.path.exists(directory_path):
             print(f"✗ 找不到文件夹：{directory_path}")
             return
         
-        directory = Path(directory_path)  # 创建路径对象
-        added_count = 0  # 记录成功添加的人脸数量
+        # 先把要处理的照片按人收集好：[(名字, [图片路径, ...]), ...]
+        # 每个子文件夹代表一个人，文件夹名字就是人的名字
+        # os.scandir 在列目录时顺带拿到文件类型，不用再对每个文件单独查询一次
+        people = []
+        with os.scandir(directory_path) as person_entries:
+            for person_entry in person_entries:
+                if not person_entry.is_dir():  # 确保是文件夹
+                    continue
+                with os.scandir(person_entry.path) as image_entries:
+                    image_paths = [
+                        image_entry.path for image_entry in image_entries
+                        if image_entry.is_file()
+                        and os.path.splitext(image_entry.name)[1].lower() in IMAGE_SUFFIXES
+                    ]
+                people.append((person_entry.name, image_paths))
         
-        # 遍历文件夹中的每个子文件夹
-        # 每个子文件夹代表一个人
-        for person_dir in directory.iterdir():
-            if person_dir.is_dir():  # 确保是文件夹
-                person_name = person_dir.name  # 文件夹名字就是人的名字
-                print(f"\n正在处理 {person_name} 的照片...")
-                
-                # 处理这个人文件夹中的每张图片
-                for image_file in person_dir.iterdir():
-                    # 检查是否是图片文件（根据后缀名判断）
-                    if image_file.suffix.lower() in ['.jpg', '.jpeg', '.png', '.bmp']:
-                        # 尝试添加这张照片中的人脸
-                        if self.add_face_from_image(str(image_file), person_name):
-                            added_count += 1  # 成功添加，计数器+1
+        # 之前导入过、而且没有改动的照片直接用缓存的特征，只处理新照片
+        cached_count = 0
+        remaining_people = []
+        for person_name, image_paths in people:
+            hits, image_paths = self._take_cached(image_paths, person_name)
+            cached_count += hits
+            remaining_people.append((person_name, image_paths))
+        people = remaining_people
+        if cached_count:
+            print(f"✓ 有 {cached_count} 张照片之前已经处理过，直接使用缓存的特征")
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        total_images = sum(len(image_paths) for _, image_paths in people)
+        
+        # 有 CUDA 或使用 YOLO 检测时走成批检测（多个进程抢同一块GPU反而更慢）
+        # 只有CPU时，每张照片互不相关，交给多个进程同时处理
+        if DLIB_USE_CUDA or self.detection_model == 'yolo' or workers <= 1 or total_images <= 1:
+            added_count = self._import_people_batched(people, progress)
+        else:
+            added_count = self._import_people_parallel(people, workers, progress)
+        added_count += cached_count
         
         print(f"\n✓ 导入完成！成功添加了 {added_count} 张人脸")
         self.save_database()  # 保存到数据库文件
+
+    def _import_people_batched(self, people, progress=None):
+        """
+        在当前进程中逐人导入，每 BATCH_SIZE 张图片一批，一起检测和提取特征
+        读图和提取特征同时进行：后台线程提前读好后面几批图片放进队列，
+        主线程从队列里取图片检测和提取特征，这样硬盘和CPU/GPU都不会闲着
+        （OpenCV 解码图片时会释放 GIL，两个线程可以真正同时运行）
+        返回成功添加的人脸数量
+        """
+        # 每个人至少一批（没有照片的人也要打印提示）
+        batches = []
+        for person_name, image_paths in people:
+            starts = range(0, len(image_paths), BATCH_SIZE) if image_paths else [0]
+            for start in starts:
+                batches.append((person_name, start, image_paths[start:start + BATCH_SIZE]))
+
+        loaded = queue.Queue(maxsize=PREFETCH_BATCHES)
+
+        def read_batches():
+            try:
+                for person_name, start, batch in batches:
+                    loaded.put((person_name, start, len(batch)) + self._load_images(batch))
+            finally:
+                loaded.put(None)  # 告诉主线程已经全部读完
+
+        reader = threading.Thread(target=read_batches, daemon=True)
+        reader.start()
+
+        added_count = 0
+        done, total = 0, sum(len(image_paths) for _, image_paths in people)
+        while True:
+            item = loaded.get()
+            if item is None:
+                break
+            person_name, start, batch_count, loaded_paths, images = item
+            if start == 0:
+                print(f"\n正在处理 {person_name} 的照片...")
+            added_count += self._add_loaded_images(loaded_paths, images, person_name)
+            done += batch_count
+            if progress is not None and batch_count:
+                progress(done, total)
+        reader.join()
+        return added_count
+
+    def _import_people_parallel(self, people, workers, progress=None):
+        """
+        用进程池并行提取所有照片的特征，结果在主进程里按顺序汇总
+        返回成功添加的人脸数量
+        """
+        names = [name for name, image_paths in people for _ in image_paths]
+        paths = [path for _, image_paths in people for path in image_paths]
+        print(f"\n正在使用 {workers} 个进程处理 {len(paths)} 张照片...")
+
+        new_rows = []
+        new_names = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            models = [self.detection_model] * len(paths)
+            results = executor.map(_encode_image, paths, names, models, chunksize=8)
+            for done, (path, name, (encoding, messages)) in enumerate(zip(paths, names, results), 1):
+                for message in messages:
+                    print(message)
+                if encoding is not None:
+                    self._cache_encoding(path, encoding)
+                    new_rows.append(encoding)
+                    new_names.append(name)
+                if progress is not None:
+                    progress(done, len(paths))
+
+        # 所有结果一次性追加到特征矩阵
+        self._append_encodings(new_rows, new_names)
+        return len(new_rows)
     
     def list_faces(self):
         """
@@ -186,27 +966,132 @@ class FaceDatabase:
         
         print(f"\n数据库中的人脸（共 {len(self.face_names)} 个）：")
         
-        # 统计每个人有多少张照片
-        from collections import Counter  # 导入计数器工具
-        name_counts = Counter(self.face_names)  # 统计每个名字出现的次数
-        
         # 按字母顺序显示每个人及其照片数量
-        for name, count in sorted(name_counts.items()):
+        for name, count in self.name_counts():
             print(f"  - {name}：{count} 张照片")
+
+    def name_counts(self):
+        """
+        【统计每个人的照片数量】
+        用 NumPy 一次性排序并计数（比逐个名字累加快得多）
+
+        返回值：
+            按名字排好序的 [(名字, 照片数量), ...] 列表
+        """
+        if not self.face_names:
+            return []
+        names, counts = np.unique(np.asarray(self.face_names, dtype=str), return_counts=True)
+        return [(str(name), int(count)) for name, count in zip(names, counts)]
+
+    def search(self, query, k=5):
+        """
+        【查找最像的人脸】
+        在数据库中查找和给定特征最接近的 k 张人脸
+        装了 faiss 时使用 HNSW 近似最近邻索引（数据库很大时也很快），
+        否则用一次矩阵乘向量算出和所有人脸的相似度
+
+        参数说明：
+            query: 一张脸的128维特征（face_recognition.face_encodings 的输出）
+            k: 最多返回多少个结果
+
+        返回值：
+            (名字列表, 欧氏距离数组)，按距离从小到大排列
+            距离小于 0.6 通常认为是同一个人
+        """
+        k = min(k, len(self.face_names))
+        if k <= 0:
+            return [], np.empty(0, dtype=np.float32)
+
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        query_norm = float(np.linalg.norm(query))
+        unit_query = (query / (query_norm + 1e-12))[None, :]
+
+        index = self._get_index()
+        if index is not None:
+            sims, ids = index.search(unit_query, k)
+            keep = ids[0] >= 0  # 近似索引找不够 k 个时用 -1 补位
+            sims, ids = sims[0][keep], ids[0][keep]
+        else:
+            all_sims = self.face_encodings @ unit_query[0]
+            ids = np.argpartition(-all_sims, k - 1)[:k]
+            sims = all_sims[ids]
+
+        # 用单位向量的相似度和各自的长度还原欧氏距离：|a-b|² = |a|² + |b|² - 2|a||b|cos
+        norms = self.face_norms[ids]
+        dist_sq = norms ** 2 + query_norm ** 2 - 2.0 * norms * query_norm * sims
+        distances = np.sqrt(np.maximum(dist_sq, 0.0))
+        order = np.argsort(distances)
+        return [self.face_names[i] for i in ids[order]], distances[order]
+
+    def _get_index(self):
+        """
+        取得 faiss 内积索引（没装 faiss 时返回 None）
+        优先读取磁盘上和数据库一致的索引文件，否则现场建立
+        """
+        if faiss is None:
+            return None
+        if self._index is not None and self._index.ntotal == len(self.face_names):
+            return self._index
+
+        index_path = index_path_for(self.db_path)
+        if (os.path.exists(index_path) and os.path.exists(self.db_path)
+                and os.path.getmtime(index_path) >= os.path.getmtime(self.db_path)):
+            try:
+                index = faiss.read_index(index_path)
+                if index.ntotal == len(self.face_names):
+                    self._index = index
+                    return index
+            except Exception as e:
+                print(f"读取索引文件失败，将重新建立：{e}")
+
+        # 单位向量的内积就是余弦相似度
+        index = faiss.IndexHNSWFlat(ENCODING_DIM, HNSW_NEIGHBORS, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        if len(self.face_encodings):
+            index.add(np.ascontiguousarray(self.face_encodings, dtype=np.float32))
+        self._index = index
+        return index
     
     def clear_database(self):
         """
         【清空数据库】
         删除数据库中的所有人脸数据
         就像把相册里的照片全部清空
-        注意：这个操作不能撤销！
+        清空后需要调用 save_database() 才会写入文件
+        注意：保存之后这个操作不能撤销！
         """
-        self.face_encodings = []  # 清空人脸特征列表
+        self.face_encodings = _as_encoding_matrix(None)  # 清空人脸特征矩阵
+        self.face_norms = np.empty(0, dtype=np.float32)  # 清空特征长度
         self.face_names = []  # 清空人脸名字列表
-        self.save_database()  # 保存空数据库
+        self._index = None  # 索引也一起清空
+        self._encoding_cache = OrderedDict()  # 特征缓存也清空
+        self._saved_rows = None  # 保存时需要整体重写
+        self._dirty = True
         print("✓ 数据库已清空")
 
 
+def repack_database(db_path):
+    """
+    【重新打包数据库】
+    读出整个数据库（包括追加日志里的人脸），按最新格式整体重写一次：
+    pickle 用最高协议，特征是一整块连续的 float32 矩阵，读取时整块读入，不用逐个还原对象
+    """
+    db = FaceDatabase(db_path, warmup=False)
+    return db.save_database(force=True)
+
+
+def convert_database(src_path, dst_path, quantize=False):
+    """
+    【转换数据库格式】
+    把数据库（包括追加日志里的人脸）另存为 dst_path 后缀名对应的格式（见 read_database_file）
+    例如转成 .npy：以后启动时特征矩阵只是内存映射打开，不管数据库多大都不用整体读入和反序列化
+    """
+    encodings, norms, names = read_database_file(src_path)
+    wal_token = None if dst_path.endswith('.npy') else os.urandom(8).hex()
+    write_database_file(dst_path, encodings, norms, names, quantize=quantize, wal_token=wal_token)
+    print(f"✓ 已把 {len(names)} 张人脸从 {src_path} 转换到 {dst_path}")
+
+
 def main():
     """
     【主函数】
@@ -216,7 +1101,18 @@ def main():
     # 就像一个接待员，理解你想做什么
     parser = argparse.ArgumentParser(description='人脸数据库管理工具')
     parser.add_argument('--db', default='face_database.pkl', 
-                       help='数据库文件路径（默认：face_database.pkl）')
+                       help='数据库文件路径（默认：face_database.pkl；以 .npy 结尾则使用内存映射格式，以 .npz 结尾则保存为 numpy 数组文件）')
+    parser.add_argument('--int8', action='store_true',
+                       help='保存时把人脸特征压缩为 int8（数据库文件缩小为四分之一）')
+    parser.add_argument('--detector', choices=DETECTION_MODELS, default=None,
+                       help='人脸检测模型（默认自动：有CUDA用cnn，否则用hog）')
+    parser.add_argument('--yolo-model', default='yolov8n-face.pt',
+                       help='--detector yolo 时使用的人脸检测权重（默认：yolov8n-face.pt）')
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                       help='YOLO 推理后端：torch、trt（TensorRT）或 openvino（适合只有CPU的电脑）；'
+                            '给出 --int8-data 时导出 INT8 引擎，否则用 FP16')
+    parser.add_argument('--int8-data',
+                       help='INT8 校准数据集（Ultralytics 数据集 yaml，图片用人脸画面）；没有时推理引擎改用 FP16')
     
     # 创建子命令（不同的操作）
     subparsers = parser.add_subparsers(dest='command', help='可用的命令')
@@ -229,6 +1125,8 @@ def main():
     # 【命令2：import - 批量导入】
     import_parser = subparsers.add_parser('import', help='从文件夹批量导入人脸')
     import_parser.add_argument('directory', help='包含人脸照片的文件夹路径')
+    import_parser.add_argument('--workers', type=int, default=None,
+                               help='并行处理照片的进程数（默认：CPU核心数；1表示不并行）')
     
     # 【命令3：list - 列出所有人脸】
     list_parser = subparsers.add_parser('list', help='列出数据库中的所有人脸')
@@ -236,6 +1134,13 @@ def main():
     # 【命令4：clear - 清空数据库】
     clear_parser = subparsers.add_parser('clear', help='清空数据库')
     
+    # 【命令5：repack - 重新打包】
+    repack_parser = subparsers.add_parser('repack', help='按最新格式重新保存数据库（合并追加日志，读取更快）')
+    
+    # 【命令6：convert - 转换格式】
+    convert_parser = subparsers.add_parser('convert', help='把数据库另存为其他格式（例如 .npy 内存映射格式）')
+    convert_parser.add_argument('output', help='新数据库文件路径（格式由后缀名决定：.npy、.npz 或 .pkl）')
+    
     # 解析命令行参数
     args = parser.parse_args()
     
@@ -244,8 +1149,19 @@ def main():
         parser.print_help()
         return
     
+    if args.command == 'repack':
+        repack_database(args.db)
+        return
+    if args.command == 'convert':
+        convert_database(args.db, args.output, quantize=args.int8)
+        return
+    
     # 创建数据库对象
-    db = FaceDatabase(args.db)
+    # 只有添加和导入人脸时才需要预热模型，查看和清空数据库不需要
+    db = FaceDatabase(args.db, detection_model=args.detector,
+                      yolo_model=args.yolo_model, backend=args.backend, quantize=args.int8,
+                      int8_data=args.int8_data,
+                      warmup=None if args.command in ('add', 'import') else False)
     
     # 根据不同的命令执行相应的操作
     if args.command == 'add':
@@ -255,7 +1171,7 @@ def main():
     
     elif args.command == 'import':
         # 批量导入人脸
-        db.import_from_directory(args.directory)
+        db.import_from_directory(args.directory, workers=args.workers)
     
     elif args.command == 'list':
         # 列出所有人脸
@@ -266,6 +1182,7 @@ def main():
         response = input("确定要清空数据库吗？这个操作不能撤销！(输入yes确认): ")
         if response.lower() == 'yes':
             db.clear_database()
+            db.save_database()  # 保存空数据库
 
 
 # 程序启动代码
@@ -10,13 +10,18 @@
 import tkinter as tk  # Tkinter - Python自带的图形界面工具
 from tkinter import ttk, filedialog, messagebox, scrolledtext  # 各种界面组件
 import threading  # 多线程工具，让程序不会卡住
+import queue  # 队列，摄像头线程把画好的画面交给界面线程显示
+import time  # 时间工具，限制摄像头预览的刷新频率
 import cv2  # OpenCV - 图像处理工具
-from PIL import Image, ImageTk  # 图像处理工具，用来在界面上显示图片
 import os  # 文件操作工具
-from face_database import FaceDatabase  # 人脸数据库管理
-from face_recognition_yolo import YOLOFaceRecognizer  # 人脸识别器
+from collections import deque  # 双端队列，攒着还没显示的日志
+# 人脸识别器（这个模块本身很轻，dlib 和 YOLO 等到创建识别器时才加载，窗口能马上打开）
+from face_recognition_yolo import YOLOFaceRecognizer, DETECTORS, open_usb_camera
 from relay_control import RelayControl  # 继电器控制
 
+# 摄像头预览每秒最多刷新几次（人眼看 24 帧已经很流畅，画布重画是界面里最耗时的操作）
+PREVIEW_FPS = 24
+
 
 class FaceRecognitionGUI:
     """
@@ -40,12 +45,29 @@ class FaceRecognitionGUI:
         # 设置变量
         self.db_path = "face_database.pkl"  # 数据库文件路径
         self.recognizer = None  # 识别器对象（暂时为空）
-        self.camera_running = False  # 摄像头是否正在运行
+        self.database = None  # 人脸数据库对象（第一次用到时才读取，之后一直复用）
+        self._stop_event = threading.Event()  # 设置后摄像头线程和读画面线程都会退出
+        self._stop_event.set()  # 一开始摄像头是关着的
+        self._camera_error = None  # 摄像头线程自己停下时的原因（由界面线程显示）
+        self._frame_queue = queue.Queue(maxsize=1)  # 画好的画面，只放最新的一帧
         self.camera_thread = None  # 摄像头线程
+        self.cap = None  # 摄像头（第一次打开后一直复用，关闭窗口时才释放）
+        self._frame_lock = threading.Lock()  # 保护最新画面，读画面线程和识别线程共用
+        self._latest_frame = None  # 读画面线程拿到的最新一帧
+        self._latest_frame_id = 0  # 最新一帧的编号（识别线程用来判断是不是新画面）
+        self.detect_interval = 3  # 摄像头每隔几帧完整识别一次
+        self.photo = None  # 画布上显示的图片（尺寸不变时重复使用）
+        self._canvas_image_id = None  # 画布上图片元素的编号
+        self._last_display_time = 0.0  # 上次显示摄像头画面的时间（用来限制预览帧率）
+        self.detect_scale = 0.5  # 摄像头画面缩小到一半再检测人脸（检测快很多）
         self.relay = RelayControl(pin=18, mode="BOARD")  # 继电器控制（BOARD 18）
+        self._pending_logs = deque()  # 还没显示到界面上的日志（其他线程也可以往里放）
+        self._import_thread = None  # 后台导入人脸的线程
+        self._import_error = None  # 后台导入失败时的错误
         
         # 创建界面
         self.create_widgets()
+        self.root.after(100, self._poll_logs)
         
     def create_widgets(self):
         """
@@ -225,6 +247,48 @@ class FaceRecognitionGUI:
         )
         self.confidence_scale.pack(side=tk.LEFT, fill=tk.X, expand=True)
 
+        # 识别间隔设置（摄像头每隔几帧完整识别一次，中间的帧沿用上次的结果）
+        interval_frame = tk.Frame(left_frame)
+        interval_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        tk.Label(
+            interval_frame,
+            text="识别间隔(帧):",
+            font=("Arial", 10)
+        ).pack(side=tk.LEFT)
+        
+        self.detect_interval_var = tk.IntVar(value=self.detect_interval)
+        self.detect_interval_scale = tk.Scale(
+            interval_frame,
+            from_=1,
+            to=10,
+            resolution=1,
+            orient=tk.HORIZONTAL,
+            variable=self.detect_interval_var,
+            command=self.on_detect_interval_change
+        )
+        self.detect_interval_scale.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        # 人脸检测方式选择（yolo：YOLO模型检测；hog：dlib HOG检测，CPU上很快）
+        detector_frame = tk.Frame(left_frame)
+        detector_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        tk.Label(
+            detector_frame,
+            text="检测方式:",
+            font=("Arial", 10)
+        ).pack(side=tk.LEFT)
+        
+        self.detector_var = tk.StringVar(value=DETECTORS[0])
+        self.detector_combo = ttk.Combobox(
+            detector_frame,
+            textvariable=self.detector_var,
+            values=DETECTORS,
+            state="readonly",
+            width=8
+        )
+        self.detector_combo.pack(side=tk.LEFT, padx=5)
+
         # 分隔线
         separator3 = ttk.Separator(left_frame, orient=tk.HORIZONTAL)
         separator3.pack(fill=tk.X, padx=10, pady=15)
@@ -326,10 +390,65 @@ class FaceRecognitionGUI:
         参数说明：
             message: 要显示的消息
         """
-        self.log_text.insert(tk.END, message + "\n")
+        self._pending_logs.append(message)
+        if threading.current_thread() is threading.main_thread():
+            self._flush_logs()
+        # 其他线程的日志由 _poll_logs 定时在界面线程里显示
+
+    def _flush_logs(self):
+        """把攒着的日志一次性插入文本框，只刷新界面显示，不处理点击等其他事件"""
+        if not self._pending_logs:
+            return
+        lines = []
+        while self._pending_logs:
+            lines.append(self._pending_logs.popleft())
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
         self.log_text.see(tk.END)  # 自动滚动到最新的日志
-        self.root.update()  # 更新界面显示
+        self.log_text.update_idletasks()  # 马上重画（后面可能是一段耗时操作）
+
+    def _poll_logs(self):
+        """每 100 毫秒显示一次其他线程放进来的日志"""
+        self._flush_logs()
+        self.root.after(100, self._poll_logs)
     
+    def get_recognizer(self):
+        """
+        取得识别器（第一次用到时才创建，之后一直复用）
+        换了检测方式时重新创建
+        """
+        detector = self.detector_var.get()
+        if self.recognizer is None or self.recognizer.detector != detector:
+            self.log(" 正在初始化识别器...")
+            self.recognizer = YOLOFaceRecognizer(
+                db_path=self.db_path,
+                confidence=self.confidence_var.get(),
+                font_path=os.getenv('CHINESE_FONT_PATH'),
+                detector=detector
+            )
+        return self.recognizer
+
+    def on_detect_interval_change(self, value):
+        """滑块改动时记下新的识别间隔（摄像头线程直接读这个数字，不去碰界面变量）"""
+        self.detect_interval = max(1, int(float(value)))
+
+    def get_database(self):
+        """
+        取得人脸数据库对象
+        只在第一次用到时读取数据库文件，之后所有按钮都复用同一个对象，不用每次点击都重新读取
+        """
+        if self.database is None:
+            from face_database import FaceDatabase  # 延迟导入：会加载 dlib，第一次用到数据库时才导入
+            self.database = FaceDatabase(self.db_path, warmup=False)
+        return self.database
+
+    def on_database_changed(self):
+        """
+        数据库改动（导入、添加、清空）后调用：
+        让已经创建的识别器直接用上数据库内存里的最新数据
+        """
+        if self.recognizer is not None:
+            self.recognizer.reload_database(self.database)
+
     def import_faces(self):
         """
         【从文件夹导入人脸】
@@ -356,15 +475,51 @@ class FaceRecognitionGUI:
         self.log(" 正在导入，请稍候...")
         
         try:
-            # 创建数据库对象并导入
-            db = FaceDatabase(self.db_path)
-            db.import_from_directory(directory)
-            
-            self.log(" 导入完成！")
-            messagebox.showinfo("成功", "人脸导入成功！")
+            db = self.get_database()
         except Exception as e:
             self.log(f" 导入失败: {str(e)}")
             messagebox.showerror("错误", f"导入失败：{str(e)}")
+            return
+        
+        # 导入很慢（每张照片都要提取特征），放到后台线程里做，界面不会卡住；
+        # 没有 GPU 时 import_from_directory 会用多个进程同时处理照片
+        # 导入期间不能再改动数据库
+        for button in (self.import_btn, self.add_face_btn, self.clear_db_btn):
+            button.config(state=tk.DISABLED)
+        self._import_error = None
+        self._import_thread = threading.Thread(
+            target=self._import_worker, args=(db, directory), daemon=True)
+        self._import_thread.start()
+        self.root.after(200, self._check_import_done)
+
+    def _import_worker(self, db, directory):
+        """后台线程：导入文件夹里的照片（导入完成后会自动保存），进度通过日志显示"""
+        def progress(done, total):
+            # 大约每 10% 报告一次进度（log 可以在后台线程里调用，由界面线程定时显示）
+            if done == total or done % max(1, total // 10) == 0:
+                self.log(f" 已处理 {done}/{total} 张照片")
+        
+        try:
+            db.import_from_directory(directory, progress=progress)
+        except Exception as e:
+            self._import_error = e
+
+    def _check_import_done(self):
+        """在界面线程里等后台导入结束，再更新识别器并弹出提示"""
+        if self._import_thread is not None and self._import_thread.is_alive():
+            self.root.after(200, self._check_import_done)
+            return
+        self._import_thread = None
+        for button in (self.import_btn, self.add_face_btn, self.clear_db_btn):
+            button.config(state=tk.NORMAL)
+        
+        if self._import_error is not None:
+            self.log(f" 导入失败: {str(self._import_error)}")
+            messagebox.showerror("错误", f"导入失败：{str(self._import_error)}")
+            return
+        self.on_database_changed()
+        self.log(" 导入完成！")
+        messagebox.showinfo("成功", "人脸导入成功！")
     
     def add_single_face(self):
         """
@@ -400,12 +555,13 @@ class FaceRecognitionGUI:
         self.log(" 正在处理...")
         
         try:
-            # 创建数据库对象并添加人脸
-            db = FaceDatabase(self.db_path)
+            # 添加人脸
+            db = self.get_database()
             success = db.add_face_from_image(image_path, name)
             
             if success:
                 db.save_database()
+                self.on_database_changed()
                 self.log(" 添加成功！")
                 messagebox.showinfo("成功", f"已成功添加 {name} 的人脸！")
             else:
@@ -424,23 +580,19 @@ class FaceRecognitionGUI:
         self.log("\n 查看数据库...")
         
         try:
-            # 加载数据库
-            db = FaceDatabase(self.db_path)
+            # 取得数据库（已经读取过就直接用内存里的数据）
+            db = self.get_database()
             
             if not db.face_names:
                 self.log(" 数据库是空的")
                 messagebox.showinfo("数据库信息", "数据库中还没有任何人脸数据")
                 return
             
-            # 统计每个人的照片数量
-            from collections import Counter
-            name_counts = Counter(db.face_names)
-            
-            # 生成显示信息
+            # 生成显示信息（每个人的照片数量，按名字排序）
             info = f"数据库中共有 {len(db.face_names)} 张人脸照片\n\n"
             info += "详细信息：\n"
             info += "-" * 30 + "\n"
-            for name, count in sorted(name_counts.items()):
+            for name, count in db.name_counts():
                 info += f" {name}: {count} 张照片\n"
                 self.log(f" {name}: {count} 张照片")
             
@@ -472,8 +624,10 @@ class FaceRecognitionGUI:
         
         try:
             # 清空数据库
-            db = FaceDatabase(self.db_path)
+            db = self.get_database()
             db.clear_database()
+            db.save_database()
+            self.on_database_changed()
             
             self.log(" 数据库已清空")
             messagebox.showinfo("完成", "数据库已清空")
@@ -507,13 +661,7 @@ class FaceRecognitionGUI:
         
         try:
             # 初始化识别器（如果还没有初始化）
-            if self.recognizer is None:
-                self.log(" 正在初始化识别器...")
-                self.recognizer = YOLOFaceRecognizer(
-                    db_path=self.db_path,
-                    confidence=self.confidence_var.get(),
-                    font_path=os.getenv('CHINESE_FONT_PATH')
-                )
+            self.get_recognizer()
             
             # 读取图片
             frame = cv2.imread(image_path)
@@ -525,11 +673,11 @@ class FaceRecognitionGUI:
             # 识别人脸
             results = self.recognizer.recognize_faces_in_frame(frame)
             
-            # 在图片上画框和标注
-            output_frame = self.recognizer.draw_results(frame, results)
+            # 在图片上画框和标注（直接得到 RGB 图片用于显示）
+            output_frame = self.recognizer.draw_results(frame, results, return_rgb=True)
             
             # 在界面上显示结果图片
-            self.display_image(output_frame)
+            self.display_image(output_frame, already_rgb=True)
             
             # 显示识别结果
             self.log(f" 识别完成！检测到 {len(results)} 张人脸：")
@@ -579,6 +727,11 @@ class FaceRecognitionGUI:
             self.log(f" 关闭继电器失败: {str(e)}")
             messagebox.showerror("错误", f"关闭继电器失败：{str(e)}")
     
+    @property
+    def camera_running(self):
+        """摄像头是否正在运行"""
+        return not self._stop_event.is_set()
+
     def toggle_camera(self):
         """
         【开关摄像头】
@@ -599,30 +752,38 @@ class FaceRecognitionGUI:
         """
         self.log("\n 正在启动摄像头...")
         
+        if self.camera_thread is not None and self.camera_thread.is_alive():
+            # 上次的摄像头线程还卡在读画面上，不能再开一个线程读同一个摄像头
+            self.log(" 上次的摄像头还没有完全停下，请稍后再试")
+            return
+        
         try:
             # 初始化识别器（如果还没有初始化）
-            if self.recognizer is None:
-                self.log(" 正在初始化识别器...")
-                self.recognizer = YOLOFaceRecognizer(
-                    db_path=self.db_path,
-                    confidence=self.confidence_var.get(),
-                    font_path=os.getenv('CHINESE_FONT_PATH')
-                )
+            self.get_recognizer()
+            
+            # 打开摄像头（已经打开过就直接复用，不用每次都重新打开）
+            if self.cap is None or not self.cap.isOpened():
+                self.cap = self.open_camera()
+            if self.cap is None:
+                self.log(" 无法打开摄像头")
+                return
             
             # 设置状态
-            self.camera_running = True
+            self._camera_error = None
+            self._stop_event.clear()
             self.camera_btn.config(text=" 关闭摄像头", bg="#F44336")
             
-            # 在新线程中运行摄像头（避免界面卡住）
+            # 在新线程中运行摄像头（避免界面卡住），画面由界面线程定时取出来显示
             self.camera_thread = threading.Thread(target=self.camera_loop, daemon=True)
             self.camera_thread.start()
+            self.root.after(15, self._drain_frame_queue)
             
             self.log(" 摄像头已启动")
             
         except Exception as e:
             self.log(f" 启动失败: {str(e)}")
             messagebox.showerror("错误", f"启动摄像头失败：{str(e)}")
-            self.camera_running = False
+            self._stop_event.set()
     
     def stop_camera(self):
         """
@@ -630,49 +791,126 @@ class FaceRecognitionGUI:
         关闭摄像头，停止识别
         """
         self.log("\n 正在关闭摄像头...")
-        self.camera_running = False
+        self._stop_event.set()
+        if self.camera_thread is not None:
+            self.camera_thread.join(timeout=1.0)
+            # 线程真的结束了才清掉；还没结束（卡在读画面上）时留着它，
+            # 下次打开摄像头前先看它停没停，避免两个线程同时读同一个摄像头
+            if not self.camera_thread.is_alive():
+                self.camera_thread = None
         self.camera_btn.config(text=" 打开摄像头识别", bg="#00BCD4")
         self.log(" 摄像头已关闭")
+
+    def _drain_frame_queue(self):
+        """
+        【显示摄像头画面】
+        在界面线程里定时取出摄像头线程放进队列的最新画面并显示
+        （Tkinter 的界面只能在界面线程里操作，摄像头线程不直接碰界面）
+        """
+        now = time.monotonic()
+        # 离上次显示还不到 1/PREVIEW_FPS 秒时先不取，新画面会替换掉队列里这一帧
+        if now - self._last_display_time >= 1.0 / PREVIEW_FPS:
+            try:
+                frame, is_rgb = self._frame_queue.get_nowait()
+            except queue.Empty:
+                pass
+            else:
+                self._last_display_time = now
+                self.display_image(frame, already_rgb=is_rgb)
+        
+        if self.camera_running:
+            self.root.after(15, self._drain_frame_queue)
+        elif self.camera_thread is not None:
+            if self.camera_thread.is_alive():
+                # 摄像头线程还在等读画面线程退出，过一会儿再看
+                self.root.after(50, self._drain_frame_queue)
+                return
+            # 摄像头线程自己停下了（打不开摄像头或读不到画面）
+            self.camera_thread = None
+            self.camera_btn.config(text=" 打开摄像头识别", bg="#00BCD4")
+            self.log(self._camera_error or " 摄像头已停止")
     
+    def grab_loop(self, cap):
+        """
+        【读画面循环】
+        在单独的线程里不停地读取摄像头画面，只保留最新的一帧
+        识别再慢也不会让摄像头的画面堆积起来（不会越来越延迟）
+        """
+        while not self._stop_event.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                self._camera_error = " 无法读取摄像头画面"
+                self._stop_event.set()
+                break
+            with self._frame_lock:
+                self._latest_frame = frame
+                self._latest_frame_id += 1
+
+    def open_camera(self, camera_id=0):
+        """
+        【打开摄像头】
+        使用 MJPG 格式和固定的分辨率、帧率（见 open_usb_camera）；打不开时返回 None
+        """
+        return open_usb_camera(camera_id)
+
     def camera_loop(self):
         """
         【摄像头循环】
-        持续读取摄像头画面并识别人脸
+        取出最新的摄像头画面并识别人脸（读画面在另一个线程里进行）
         这个函数在单独的线程中运行，不会卡住界面
         """
-        # 打开摄像头
-        cap = cv2.VideoCapture(0)
-        
-        if not cap.isOpened():
-            self.log(" 无法打开摄像头")
-            self.camera_running = False
-            return
+        cap = self.cap  # 在 start_camera 里已经打开好了
+        with self._frame_lock:
+            self._latest_frame = None
+            self._latest_frame_id = 0
+        grab_thread = threading.Thread(target=self.grab_loop, args=(cap,), daemon=True)
+        grab_thread.start()
         
         frame_count = 0
-        
-        # 持续读取画面
-        while self.camera_running:
-            ret, frame = cap.read()
-            if not ret:
-                break
+        last_frame_id = 0
+        last_results = []  # 上次识别的结果，不识别的帧沿用它
+        
+        # 持续处理最新画面
+        while not self._stop_event.is_set():
+            with self._frame_lock:
+                frame = self._latest_frame
+                frame_id = self._latest_frame_id
+            if frame is None or frame_id == last_frame_id:
+                # 还没有新画面，稍等一下（要关闭摄像头时立刻醒来）
+                self._stop_event.wait(0.005)
+                continue
+            last_frame_id = frame_id
             
-            # 每一帧都识别（如果电脑慢可以改成每隔几帧识别一次）
-            if frame_count % 1 == 0:
-                try:
-                    results = self.recognizer.recognize_faces_in_frame(frame)
-                    frame = self.recognizer.draw_results(frame, results)
-                except:
-                    pass
+            # 每隔几帧完整识别一次，中间的帧直接画上次的框（人在几帧之间移动很小）
+            try:
+                if frame_count % self.detect_interval == 0:
+                    last_results = self.recognizer.recognize_faces_in_frame(
+                        frame, detect_scale=self.detect_scale, use_cache=True, use_tracking=True)
+                frame = self.recognizer.draw_results(frame, last_results, return_rgb=True)
+                is_rgb = True
+            except:
+                is_rgb = False
             
             frame_count += 1
             
-            # 在界面上显示
-            self.display_image(frame)
-        
-        # 释放摄像头
-        cap.release()
+            # 交给界面线程显示；界面还没取走上一帧时，用这一帧替换掉它
+            try:
+                self._frame_queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self._frame_queue.put_nowait((frame, is_rgb))
+            except queue.Full:
+                pass
+        
+        # 等读画面线程真正结束（摄像头线程结束就说明没有线程在读这个摄像头了）；
+        # 摄像头留着下次打开时复用，读不到画面时才释放（下次重新打开）
+        grab_thread.join()
+        if self._camera_error is not None:
+            cap.release()
+            self.cap = None
     
-    def display_image(self, cv_image):
+    def display_image(self, cv_image, already_rgb=False):
         """
         【在界面上显示图片】
         把OpenCV的图片转换成Tkinter能显示的格式
@@ -680,11 +918,9 @@ class FaceRecognitionGUI:
         
         参数说明：
             cv_image: OpenCV格式的图片（BGR）
+            already_rgb: 图片已经是 RGB 格式时传 True，省掉一次颜色转换
         """
         try:
-            # 转换颜色格式（BGR -> RGB）
-            rgb_image = cv2.cvtColor(cv_image, cv2.COLOR_BGR2RGB)
-            
             # 调整图片大小以适应画布
             canvas_width = self.canvas.winfo_width()
             canvas_height = self.canvas.winfo_height()
@@ -693,27 +929,40 @@ class FaceRecognitionGUI:
                 canvas_width, canvas_height = 640, 480
             
             # 计算缩放比例（保持宽高比）
-            h, w = rgb_image.shape[:2]
+            h, w = cv_image.shape[:2]
             scale = min(canvas_width / w, canvas_height / h) * 0.95
             new_w, new_h = int(w * scale), int(h * scale)
             
-            # 调整大小
-            resized = cv2.resize(rgb_image, (new_w, new_h))
+            # 先调整大小：缩小用 INTER_AREA（画质好），放大用 INTER_LINEAR（更快）
+            interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+            resized = cv2.resize(cv_image, (new_w, new_h), interpolation=interpolation)
             
-            # 转换为PIL图片
-            pil_image = Image.fromarray(resized)
+            # 再转换颜色格式（BGR -> RGB），只转换缩小后的图片
+            if not already_rgb:
+                resized = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
             
-            # 转换为Tkinter图片
-            self.photo = ImageTk.PhotoImage(image=pil_image)
+            # 直接拼成 PPM 格式的数据交给 Tkinter，不经过 PIL
+            ppm_data = b'P6 %d %d 255 ' % (new_w, new_h) + resized.tobytes()
             
-            # 清空画布并显示图片
-            self.canvas.delete("all")
-            self.canvas.create_image(
-                canvas_width // 2,
-                canvas_height // 2,
-                image=self.photo,
-                anchor=tk.CENTER
-            )
+            if self.photo is not None and (self.photo.width(), self.photo.height()) == (new_w, new_h):
+                # 尺寸没变：直接更新原来那张图片的内容，不用新建图片
+                self.photo.configure(data=ppm_data, format='PPM')
+                self.canvas.coords(self._canvas_image_id, canvas_width // 2, canvas_height // 2)
+            elif self._canvas_image_id is not None:
+                # 尺寸变了：新建图片，换到原来的图片元素上，不用删掉再创建
+                self.photo = tk.PhotoImage(width=new_w, height=new_h, data=ppm_data, format='PPM')
+                self.canvas.itemconfig(self._canvas_image_id, image=self.photo)
+                self.canvas.coords(self._canvas_image_id, canvas_width // 2, canvas_height // 2)
+            else:
+                # 第一次显示：新建图片，清掉提示文字后显示
+                self.photo = tk.PhotoImage(width=new_w, height=new_h, data=ppm_data, format='PPM')
+                self.canvas.delete("all")
+                self._canvas_image_id = self.canvas.create_image(
+                    canvas_width // 2,
+                    canvas_height // 2,
+                    image=self.photo,
+                    anchor=tk.CENTER
+                )
             
         except Exception as e:
             pass  # 忽略显示错误
@@ -725,6 +974,9 @@ class FaceRecognitionGUI:
         """
         if self.camera_running:
             self.stop_camera()
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
         # 清理继电器 GPIO
         try:
             self.relay.cleanup()
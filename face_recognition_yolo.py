@@ -9,17 +9,205 @@
 # 导入需要的工具包
 import cv2  # OpenCV - 图像处理工具，可以读取和处理图片
 import numpy as np  # NumPy - 数学计算工具，用来处理数字和数组
-import face_recognition  # 人脸识别工具
-import pickle  # 用来读取保存的数据
 import os  # 操作系统工具
-from ultralytics import YOLO  # YOLO模型 - 快速物体检测工具
+import sys  # 系统工具，按操作系统选择摄像头驱动
+import glob  # 展开 *.jpg 这样的文件名通配符
+import time  # 时间工具，识别结果缓存用来判断是否过期
+import threading  # 线程，摄像头模式下一边读画面一边识别
+import queue  # 队列，识别线程把结果交给主线程显示
+from collections import OrderedDict, deque  # 有顺序的字典（“最久没用的先删掉”的缓存）和定长队列
 try:
-    import torch  # 可选：用于检测CUDA与半精度可用性
+    import faiss  # 可选：向量检索库，用 C++/SIMD 一次算完和所有已知人脸的距离
 except Exception:
-    torch = None
+    faiss = None
+try:
+    from numba import njit  # 可选：把小数据库的距离计算编译成机器码（一遍循环算完，不用临时数组）
+except Exception:
+    njit = None
 from PIL import Image, ImageDraw, ImageFont  # 使用Pillow渲染中文文字
+from model_export import BACKENDS, MAX_BATCH, load_yolo_model  # YOLO 模型加载（可选导出 TensorRT/OpenVINO 推理引擎）
 from typing import Optional, List, Dict, Union
 
+# 下面几个工具包加载很慢（dlib、PyTorch），等到真正创建识别器时才导入（见 _import_heavy_modules）
+# 只用到这个模块里常量的程序（比如图形界面）启动时就不用等它们加载
+face_recognition = None  # 人脸识别工具
+face_database = None  # 人脸数据库（读取数据库文件、批量提取特征）
+torch = None  # 可选：用于检测CUDA与半精度可用性
+
+
+def _import_heavy_modules() -> None:
+    """
+    导入 face_recognition、face_database 和 torch（可选）；已经导入过的不会重复导入
+    （ultralytics 在 load_yolo_model 里导入，只有用 YOLO 检测时才会加载）
+    """
+    global face_recognition, face_database, torch
+    if face_recognition is None:
+        import face_recognition as face_recognition_module
+        face_recognition = face_recognition_module
+    if face_database is None:
+        import face_database as face_database_module
+        face_database = face_database_module
+    if torch is None:
+        try:
+            import torch as torch_module
+            torch = torch_module
+        except Exception:
+            pass
+
+# faiss 索引类型：'flat' 精确暴力搜索；'ivf' 倒排聚类（需要训练）；'hnsw' 图索引（不用训练）
+# 'auto' 时数据库小于 FLAT_INDEX_MAX 张脸用 'flat'，更大时用 'ivf'
+INDEX_TYPES = ('auto', 'flat', 'ivf', 'hnsw')
+FLAT_INDEX_MAX = 2000
+IVF_NPROBE = 16  # 每次搜索查看的聚类数（太小会漏掉匹配）
+HNSW_NEIGHBORS = 32
+# 索引里特征的存储精度：'fp32' 原样保存；'fp16' / 'int8' 用标量量化压缩成一半 / 四分之一，
+# 比对主要受内存带宽限制，数据越小搜索越快（候选最后仍按 float32 特征精确重排，几乎不影响准确率）
+STORAGE_PRECISIONS = ('fp32', 'fp16', 'int8')
+# 数据库特征放在 GPU 上时的数据类型：'fp16' 半精度矩阵乘法；'int8' 整数矩阵乘法（Tensor Core INT8，
+# 数据量只有 fp16 的一半），每行特征另存一个缩放比例
+DB_DTYPES = ('fp16', 'int8')
+
+# 人脸检测方式：'yolo' 用 YOLO 模型检测；'hog' 直接用 dlib 的 HOG 人脸检测（不加载 YOLO）
+DETECTORS = ('yolo', 'hog')
+# 默认 YOLO 模型：下载了人脸专用模型就用它，否则用通用模型（会自动下载）
+DEFAULT_YOLO_MODEL = 'yolov8n-face.pt' if os.path.exists('yolov8n-face.pt') else 'yolov8n.pt'
+
+# YOLO 推理时的输入尺寸
+YOLO_IMGSZ = 640
+# 预热用的画面大小（高, 宽）：和常见摄像头画面一样，预热后第一帧真实画面不用再重新准备
+WARMUP_FRAME_SHAPE = (720, 1280)
+# 批量处理多张图片时，每批一起送进 YOLO 的图片数量
+IMAGE_BATCH_SIZE = 8
+# 摄像头模式下攒够几帧画面一起送进 YOLO：默认 1 帧（每 TRACK_DETECT_INTERVAL 帧检测一次，延迟最低）；
+# 大于 1 时每一帧都检测，一批画面一次推理（GPU 一次推理多帧比一帧一帧推理效率高很多，但要多等几帧）
+CAMERA_BATCH_SIZE = 1
+# USB 摄像头画面格式：让摄像头自己压缩成 MJPG 再传过来（USB 带宽小很多），分辨率和帧率固定
+# 默认的 YUYV 格式受 USB 2.0 带宽限制，1080p 时往往只有不到 10 帧每秒
+CAMERA_WIDTH = 1280
+CAMERA_HEIGHT = 720
+CAMERA_FPS = 30
+CAMERA_FOURCC = 'MJPG'
+# 识别好、等着显示的画面最多几帧（显示跟不上时识别线程先等一等，延迟不会越积越多）
+DISPLAY_QUEUE_SIZE = 2
+
+# 人脸框的最小边长（像素）和宽高比范围：太小或形状不像脸的框提取不出可用的特征，直接标为未知
+MIN_FACE_SIZE = 40
+FACE_ASPECT_RANGE = (0.5, 2.0)
+
+# 欧氏距离小于这个值认为是同一个人（经验阈值）
+MATCH_THRESHOLD = 0.6
+# 按余弦相似度先取出这么多个候选，再用精确的欧氏距离重新排序
+MATCH_CANDIDATES = 8
+# 没有 faiss 时，数据库少于这么多张脸且装了 numba 就用编译好的循环比对（人少时矩阵乘法的开销占大头）
+NUMBA_MAX_FACES = 1000
+
+# 摄像头识别结果缓存：同一张脸（人脸小图的感知哈希相同）在 CROP_CACHE_TTL 秒内直接沿用上次的结果，
+# 不再提取特征和比对；最多记住 CROP_CACHE_SIZE 张脸
+CROP_CACHE_SIZE = 128
+CROP_CACHE_TTL = 2.0
+# 画好的标签小图最多记住多少种（名字 × 信心值 × 颜色，超过就清空重新画）
+LABEL_CACHE_SIZE = 1024
+# 摄像头人脸跟踪：每 TRACK_DETECT_INTERVAL 帧才用 YOLO 检测一次，中间的帧沿用上次的结果；
+# 检测到的框和上次的人脸框重叠（IoU）超过 TRACK_IOU_THRESHOLD 时认为是同一个人，直接沿用名字，
+# 不再提取特征；同一张脸每 TRACK_REFRESH 秒重新识别一次，防止一直沿用认错的名字
+TRACK_DETECT_INTERVAL = 5
+TRACK_IOU_THRESHOLD = 0.4
+TRACK_REFRESH = 2.0
+# 摄像头跳过相似画面（--skip-similar）：整帧 8x8 平均哈希和上次检测的画面相差不到这么多位时，
+# 认为画面没变（比如人坐着不动），不再检测，直接沿用上次的结果
+SKIP_SIMILAR_THRESHOLD = 4
+# OpenCV 的图像哈希模块（需要 opencv-contrib）；没有时用 NumPy 计算平均哈希
+_img_hash = getattr(cv2, 'img_hash', None)
+
+
+def jetson_csi_pipeline(sensor_id: int = 0, width: int = 1280, height: int = 720, fps: int = 30) -> str:
+    """
+    Jetson CSI 摄像头的 GStreamer 管道（交给 cv2.VideoCapture(..., cv2.CAP_GSTREAMER) 打开）
+    摄像头输出的 NV12 画面留在 GPU 能直接访问的内存（NVMM）里，由 nvvidconv 用专用硬件转换颜色，
+    CPU 只需要把 BGRx 去掉一个通道变成 OpenCV 用的 BGR；appsink 只留最新的一帧
+    """
+    return (f"nvarguscamerasrc sensor-id={sensor_id} ! "
+            f"video/x-raw(memory:NVMM),width={width},height={height},format=NV12,framerate={fps}/1 ! "
+            f"nvvidconv ! video/x-raw,format=BGRx ! videoconvert ! video/x-raw,format=BGR ! "
+            f"appsink drop=true max-buffers=1")
+
+
+def expand_image_paths(patterns: List[str]) -> List[str]:
+    """展开命令行给的图片路径里的通配符（Windows 的命令行不会自己展开 *.jpg）；没有匹配时原样保留"""
+    paths = []
+    for pattern in patterns:
+        matched = sorted(glob.glob(pattern)) if any(c in pattern for c in '*?[') else []
+        paths.extend(matched or [pattern])
+    return paths
+
+
+def open_usb_camera(camera_id: int = 0, width: int = CAMERA_WIDTH, height: int = CAMERA_HEIGHT,
+                    fps: int = CAMERA_FPS, fourcc: str = CAMERA_FOURCC):
+    """
+    打开 USB 摄像头，并设置好画面格式（fourcc）、分辨率和帧率；打不开时返回 None
+    Windows 用 DirectShow，Linux 用 V4L2 驱动（设置格式更可靠），不行再用 OpenCV 默认的方式
+    """
+    if os.name == 'nt':
+        backend = cv2.CAP_DSHOW
+    elif sys.platform.startswith('linux'):
+        backend = cv2.CAP_V4L2
+    else:
+        backend = cv2.CAP_ANY
+    cap = cv2.VideoCapture(camera_id, backend)
+    if not cap.isOpened() and backend != cv2.CAP_ANY:
+        cap = cv2.VideoCapture(camera_id)
+    if not cap.isOpened():
+        return None
+    
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    cap.set(cv2.CAP_PROP_FPS, fps)
+    # 驱动里只缓存1帧，读到的总是最新画面
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return cap
+
+
+def _frame_hash(frame: np.ndarray) -> int:
+    """整帧画面的 64 位平均哈希：缩小到 8x8、各通道取平均，比平均亮度亮的位置记 1"""
+    small = cv2.resize(frame, (8, 8), interpolation=cv2.INTER_AREA).mean(axis=2)
+    return int.from_bytes(np.packbits(small > small.mean()).tobytes(), 'big')
+
+
+def _box_iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """两组框 (x1, y1, x2, y2) 两两之间的交并比（IoU），返回 (len(a), len(b)) 的矩阵"""
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _nearest_faces(known, queries):
+        """
+        每张脸和数据库里每张脸逐个比较：相减、平方、求和、找最小值在一遍循环里完成
+        返回 (每张脸最像的下标, 对应的欧氏距离平方)
+        """
+        best_ids = np.zeros(queries.shape[0], dtype=np.int64)
+        best_distances = np.full(queries.shape[0], np.inf, dtype=np.float32)
+        for q in range(queries.shape[0]):
+            for i in range(known.shape[0]):
+                total = np.float32(0.0)
+                for j in range(known.shape[1]):
+                    diff = known[i, j] - queries[q, j]
+                    total += diff * diff
+                if total < best_distances[q]:
+                    best_distances[q] = total
+                    best_ids[q] = i
+        return best_ids, best_distances
+else:
+    _nearest_faces = None
+
 
 class YOLOFaceRecognizer:
     """
@@ -30,9 +218,12 @@ class YOLOFaceRecognizer:
     3. 在脸上画框并标注名字
     """
     
-    def __init__(self, db_path='face_database.pkl', yolo_model='yolov8n.pt', confidence=0.5,
+    def __init__(self, db_path='face_database.pkl', yolo_model=DEFAULT_YOLO_MODEL, confidence=0.5,
                  font_path: Optional[str] = None, font_size: int = 20,
-                 device: Optional[Union[str, int]] = None, use_half: Optional[bool] = None):
+                 device: Optional[Union[str, int]] = None, use_half: Optional[bool] = None,
+                 index_type: str = 'auto', detector: str = 'yolo', storage_precision: str = 'fp32',
+                 backend: str = 'torch', int8: bool = False, channels_last: Optional[bool] = None,
+                 db_device: Optional[str] = None, db_dtype: str = 'fp16', int8_data: Optional[str] = None):
         """
         【初始化识别器】
         准备好识别器需要的所有工具和数据
@@ -40,30 +231,117 @@ class YOLOFaceRecognizer:
         参数说明：
             db_path: 人脸数据库文件的位置
             yolo_model: YOLO模型文件（用来检测人脸位置）
+                        推荐人脸专用模型（如 yolov8n-face.pt）；通用模型（如 yolov8n.pt）只能找到"人"，
+                        还要在人的框里再找一次脸
             confidence: 信心阈值（0到1之间，越高要求越严格）
                        例如0.5表示至少有50%把握才认为找到了人脸
+            index_type: faiss 索引类型 'auto'、'flat'、'ivf' 或 'hnsw'（见 INDEX_TYPES）
+            detector: 人脸检测方式 'yolo' 或 'hog'（'hog' 不加载 YOLO 模型）
+            storage_precision: faiss 索引里特征的存储精度 'fp32'、'fp16' 或 'int8'（见 STORAGE_PRECISIONS）
+            backend: YOLO 推理后端 'torch'、'trt'（TensorRT，适合 Jetson）或 'openvino'（见 model_export）
+                     第一次使用时导出推理引擎，之后直接加载（TensorRT 引擎按 GPU、CUDA/TensorRT 版本、
+                     输入尺寸和精度缓存在 model_export.ENGINE_CACHE_DIR，即 ~/.cache/face_rec；
+                     OpenVINO 模型保存在模型文件旁边）
+            int8: 导出推理引擎时使用 INT8 精度（否则按 use_half 使用 FP16 或 FP32）
+            int8_data: INT8 校准用的数据集 yaml（人脸画面）；不给时 int8 改用 FP16（见 model_export）
+            channels_last: PyTorch 模型在 GPU 上使用 NHWC（channels_last）内存布局，
+                           FP16 卷积可以用上 Tensor Core 最快的算法（默认：CUDA + FP16 时自动开启）
+            db_device: 把数据库特征以 FP16 放到这个 GPU 上（如 'cuda' 或 'cuda:0'），
+                       比对时在 GPU 上一次矩阵乘法算出相似度（不再使用 faiss 索引）；默认在 CPU 上比对
+            db_dtype: 放在 GPU 上的数据库特征的数据类型 'fp16' 或 'int8'（见 DB_DTYPES）
         """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"index_type must be one of {INDEX_TYPES}")
+        if storage_precision not in STORAGE_PRECISIONS:
+            raise ValueError(f"storage_precision must be one of {STORAGE_PRECISIONS}")
+        if detector not in DETECTORS:
+            raise ValueError(f"detector must be one of {DETECTORS}")
+        if backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {BACKENDS}")
+        if db_dtype not in DB_DTYPES:
+            raise ValueError(f"db_dtype must be one of {DB_DTYPES}")
+        _import_heavy_modules()
+        self.detector = detector  # 人脸检测方式
         self.db_path = db_path  # 保存数据库路径
+        self.index_type = index_type  # faiss 索引类型
+        self.storage_precision = storage_precision  # faiss 索引里特征的存储精度
         self.confidence = confidence  # 保存信心阈值
         self.known_face_encodings = []  # 存放已知人脸的特征（空列表）
+        self.known_unit_encodings = np.empty((0, 128), dtype=np.float32)  # 归一化后的特征（单位向量）
+        self.known_face_norms = np.empty(0, dtype=np.float32)  # 每个特征原来的长度
+        self._known_norms_sq = np.empty(0, dtype=np.float32)  # 长度的平方（算欧氏距离时用，提前算好）
         self.known_face_names = []  # 存放已知人脸的名字（空列表）
+        self.face_index = None  # faiss 距离索引（装了 faiss 时在加载数据库后建立）
+        self._faiss_gpu = None  # faiss 的 GPU 资源（有 GPU 版 faiss 时才创建）
+        self.db_device = self._resolve_db_device(db_device)  # 数据库特征放在哪个 GPU 上（None 表示 CPU）
+        self.db_dtype = db_dtype  # GPU 上数据库特征的数据类型
+        if db_dtype == 'int8' and self.db_device is not None and not hasattr(torch, '_int_mm'):
+            print(" 提示：这个版本的 PyTorch 不支持 int8 矩阵乘法（需要 2.2 以上），改用 fp16")
+            self.db_dtype = 'fp16'
+        self._gpu_gallery = None  # GPU 上的数据库特征：(特征矩阵, int8 时每行的缩放比例，fp16 时为 None)
+        self._crop_cache = OrderedDict()  # 人脸小图哈希 -> (名字, 信心值, 识别时间)
+        self._tracks = []  # 上一帧的人脸：(位置框, 名字, 信心值, 识别时间)，跟踪用
         # 中文文字渲染配置
         self.font_path = font_path  # 可选：自定义中文字体路径
         self.font_size = font_size  # 可选：中文标签字号
         self._font = None  # 延迟加载字体
+        self._label_sprites = {}  # (标签文字, 背景色) -> 画好的标签小图
         # 推理设备/精度配置（为 Jetson GPU 友好）
         self.yolo_device = self._resolve_device(device)
         self.yolo_half = self._resolve_half_precision(use_half)
+        self.yolo_imgsz = YOLO_IMGSZ
+        if self.yolo_device not in (None, 'cpu', 'mps') or self.db_device is not None:
+            self._enable_tf32()
         
         # 加载人脸数据库
         self.load_database()
         
+        self.yolo_model = None
+        self._pinned_capable = False  # 能不能用锁页内存输入（PyTorch 后端并且在 CUDA 上推理）
+        self._pinned_input = False  # 是否通过锁页内存把画面传到 GPU（见 _pinned_yolo_input）
+        self._input_path_choices = {}  # (画面高宽, 批量) -> 是否用锁页内存，process_camera 第一次用到时计时决定
+        self._pinned_host = None  # 锁页内存里的输入缓冲区（批量、尺寸不变时一直复用）
+        self._pinned_key = None  # 缓冲区的 (高, 宽)；批量按 MAX_BATCH 分配，每次只用前面几张
+        self._pinned_device = None  # GPU 上对应的输入缓冲区（uint8，和锁页内存一样大）
+        self._nms = None  # Ultralytics 的 NMS 函数（锁页内存输入直接调用网络时用）
+        self._copy_stream = None  # 专门用来往 GPU 复制画面的 CUDA 流
+        self.channels_last = False  # YOLO 模型和输入是否使用 channels_last 内存布局
+        self.is_face_model = False  # 是否是人脸专用的 YOLO 模型
+        self.target_classes = set()  # 需要保留的 YOLO 类别编号（人脸，或通用模型里的"人"）
+        if self.detector == 'hog':
+            print(" 使用 HOG 人脸检测（不加载YOLO模型）")
+            return
+        
         # 初始化YOLO模型
-        print("正在加载YOLO模型...")
-        self.yolo_model = YOLO(yolo_model)  # 加载AI模型
-        print(f" YOLO模型加载完成（device={self.yolo_device or 'auto'}, half={self.yolo_half}）")
+        print(f"正在加载YOLO模型...（后端：{backend}）")
+        self.yolo_model = load_yolo_model(  # 加载AI模型（需要时先导出推理引擎）
+            yolo_model, backend=backend, device=self.yolo_device,
+            half=bool(self.yolo_half), int8=int8, imgsz=self.yolo_imgsz, data=int8_data,
+        )
+        class_names = {int(i): str(n).lower() for i, n in self.yolo_model.names.items()}
+        face_classes = {i for i, n in class_names.items() if n == 'face'}
+        self.is_face_model = bool(face_classes)
+        # 通用模型（COCO）只保留"人"的框，其他类别（车、椅子……）不用管
+        self.target_classes = face_classes or {i for i, n in class_names.items() if n == 'person'}
+        # 推理时就告诉 YOLO 只要这些类别：其他类别的框在 NMS 里就去掉，不会传回来，
+        # 更不会被当成"人"拿去找脸
+        self._yolo_classes = sorted(self.target_classes)
+        print(f" YOLO模型加载完成（device={self.yolo_device or 'auto'}, half={self.yolo_half}，"
+              f"{'人脸专用模型' if self.is_face_model else '通用模型，会在人的框里再找脸'}）")
+        if self.yolo_device not in (None, 'cpu', 'mps') and not face_database.DLIB_USE_CUDA:
+            # YOLO 在 GPU 上以后，CPU 上提取人脸特征（dlib ResNet）就成了最慢的一步
+            print(" 提示：dlib 没有编译 CUDA 支持，人脸特征在 CPU 上提取；"
+                  "安装带 CUDA 的 dlib 后，每批人脸的特征会在 GPU 上一次算完")
+        # 用 PyTorch 在 CUDA 上推理时，画面经过固定的锁页内存直接传到 GPU，颜色转换和归一化也在 GPU 上做
+        self._pinned_capable = self._pinned_input = (backend == 'torch' and torch is not None
+                                                     and self.yolo_device not in (None, 'cpu', 'mps')
+                                                     and torch.cuda.is_available())
         # 轻量化 GPU 预热，降低首帧延迟
         self._warmup_model()
+        if channels_last is None:
+            channels_last = self._pinned_input and bool(self.yolo_half)
+        if channels_last and self._pinned_input:
+            self._use_channels_last()
 
     def _resolve_device(self, device_hint: Optional[Union[str, int]]) -> Optional[Union[str, int]]:
         # 显式指定优先
@@ -86,17 +364,86 @@ class YOLOFaceRecognizer:
         except Exception:
             return False
 
-    def _warmup_model(self) -> None:
+    @staticmethod
+    def _enable_tf32() -> None:
+        """
+        允许 PyTorch 在 CUDA 上用 TF32 算 float32 矩阵乘法和卷积（Ampere 以后的 GPU 用 Tensor Core，
+        快好几倍，精度对检测和比对没有影响；更早的 GPU 和 Jetson Nano 上这些设置不起作用）
+        """
+        if torch is None:
+            return
+        try:
+            torch.set_float32_matmul_precision('high')
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+        except Exception:
+            pass
+
+    def _warmup_model(self, frame_shape=WARMUP_FRAME_SHAPE) -> None:
         try:
-            # 仅在 CUDA 上进行一次小分辨率的空跑，触发内核编译/权重搬运
+            # 仅在 CUDA 上空跑一次，触发内核编译/权重搬运
             if self.yolo_device == 'cpu' or self.yolo_device == 'mps':
                 return
-            dummy = np.zeros((320, 320, 3), dtype=np.uint8)
-            _ = self.yolo_model(dummy, verbose=False, device=self.yolo_device, half=self.yolo_half)
+            # 用和真实画面一样大小的空白画面走一遍真实的检测流程（同样的缩放、同样的输入尺寸），
+            # Ultralytics 按这个输入形状准备好的缓冲区和锁页内存之后都能直接复用
+            dummy = np.zeros((*frame_shape, 3), dtype=np.uint8)
+            self._detect_faces_batch([dummy], [dummy])
         except Exception:
             # 预热失败不应影响后续功能
             pass
 
+    def _choose_input_path(self, frame_shape=WARMUP_FRAME_SHAPE, batch_size: int = CAMERA_BATCH_SIZE,
+                           repeats: int = 3) -> None:
+        """
+        用一批和摄像头一样大小的空白画面，分别计时锁页内存输入（_pinned_yolo_input）和
+        直接把 NumPy 画面交给 Ultralytics 两种方式，保留快的那一种
+        （锁页内存在 Jetson 这类 CPU 和 GPU 共用内存的设备上不一定更快）
+        要多跑好几次推理，只在 process_camera 里调用；同样的画面大小和批量只计时一次
+        """
+        key = (tuple(frame_shape), batch_size)
+        if key in self._input_path_choices:
+            self._pinned_input = self._input_path_choices[key]
+            return
+        frames = [np.zeros((*frame_shape, 3), dtype=np.uint8)] * batch_size
+
+        def timed(pinned):
+            self._pinned_input = pinned
+            self._detect_faces_batch(frames, frames)  # 先跑一次，不计入时间
+            torch.cuda.synchronize()
+            start = time.perf_counter()
+            for _ in range(repeats):
+                self._detect_faces_batch(frames, frames)
+            torch.cuda.synchronize()
+            return (time.perf_counter() - start) / repeats
+
+        try:
+            pinned_time = timed(True)
+            if not self._pinned_input:
+                return  # 锁页内存方式出错，_detect_faces_batch 已经改用默认方式
+            numpy_time = timed(False)
+        except Exception as e:
+            print(f" 无法比较两种画面输入方式，使用默认方式：{e}")
+            self._pinned_input = False
+            return
+        self._pinned_input = self._input_path_choices[key] = pinned_time < numpy_time
+        print(f" 画面输入方式：{'锁页内存' if self._pinned_input else '默认'}"
+              f"（锁页内存 {pinned_time * 1000:.1f} ms / 默认 {numpy_time * 1000:.1f} ms 每批）")
+
+    def _use_channels_last(self) -> None:
+        """
+        把 YOLO 的网络换成 channels_last 内存布局（要在预热之后做：Ultralytics 第一次推理时
+        会合并卷积和 BN 层，生成新的权重）
+        """
+        predictor = getattr(self.yolo_model, 'predictor', None)
+        network = getattr(getattr(predictor, 'model', None), 'model', None)
+        if network is None:
+            return
+        try:
+            network.to(memory_format=torch.channels_last)
+            self.channels_last = True
+        except Exception as e:
+            print(f" 无法使用 channels_last 内存布局：{e}")
+
     def _resolve_font_path(self) -> Optional[str]:
         """
         解析中文字体路径：优先使用传入的 font_path 或环境变量，其次尝试常见系统路径。
@@ -146,23 +493,54 @@ class YOLOFaceRecognizer:
             self._font = ImageFont.load_default()
         return self._font
 
-    def _draw_labels_pil(self, frame: np.ndarray, labels_info: List[Dict]) -> np.ndarray:
+    def _label_sprite(self, text: str, bg_color: tuple) -> np.ndarray:
+        """
+        用 Pillow 画出一个标签（背景色矩形 + 白色文字）的小图，同样的标签只画一次
+        （摄像头画面里同样的标签每帧都要画，之后直接把缓存的小图复制到画面上）
+        bg_color 按图片自己的通道顺序给出，返回的小图也是同样的通道顺序
+        """
+        key = (text, bg_color)
+        sprite = self._label_sprites.get(key)
+        if sprite is not None:
+            return sprite
+        font = self._get_font()
+        drawer = ImageDraw.Draw(Image.new('RGB', (1, 1)))  # 只用来测量文字尺寸
+        try:
+            left, top, right, bottom = drawer.textbbox((0, 0), text, font=font)
+        except Exception:
+            # 旧 Pillow 兜底
+            right, bottom = drawer.textsize(text, font=font)
+            left, top = 0, 0
+        text_w = max(1, right - left)
+        text_h = max(1, bottom - top)
+        # 文字四周留白：左右各 4 像素、上下 3 像素
+        label = Image.new('RGB', (text_w + 9, text_h + 7), bg_color)
+        ImageDraw.Draw(label).text((4 - left, 3 - top), text, fill=(255, 255, 255), font=font)
+        sprite = np.asarray(label)
+        if len(self._label_sprites) >= LABEL_CACHE_SIZE:
+            self._label_sprites.clear()
+        self._label_sprites[key] = sprite
+        return sprite
+
+    def _draw_labels_pil(self, frame: np.ndarray, labels_info: List[Dict],
+                         return_rgb: bool = False) -> np.ndarray:
         """
         使用 Pillow 在图像上绘制中文标签，避免 OpenCV putText 的中文乱码问题。
 
+        每个标签用 Pillow 画成一张小图并缓存起来（见 _label_sprite），再直接复制到图片上，
+        不用把整张图片转成 RGB 再转回来：背景色按图片自己的通道顺序给出，文字是白色，
+        所以 BGR 图片可以直接画（标签直接画在 frame 上）
+
         labels_info: 每项包含 {text, x1, y1, x2, y2, bg_bgr}
-        返回：绘制完标签的 BGR 图像
+        return_rgb: 为 True 时直接返回 RGB 图像（要在界面上显示时可以少转换一次颜色）
+        返回：绘制完标签的 BGR 图像（return_rgb=True 时为 RGB 图像）
         """
+        # 要 RGB 时整张图只转换这一次，标签直接画在转换后的图片上
+        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) if return_rgb else frame
         if not labels_info:
-            return frame
-
-        # OpenCV(BGR ndarray) -> PIL(RGB Image)
-        rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(rgb_image)
-        drawer = ImageDraw.Draw(pil_image)
-        font = self._get_font()
+            return image
 
-        image_height, image_width = frame.shape[:2]
+        image_height, image_width = image.shape[:2]
 
         for info in labels_info:
             text = info['text']
@@ -172,35 +550,28 @@ class YOLOFaceRecognizer:
             y2 = info['y2']
             bg_bgr = info['bg_bgr']
 
-            # 计算文本尺寸
-            try:
-                left, top, right, bottom = drawer.textbbox((0, 0), text, font=font)
-                text_w = max(1, right - left)
-                text_h = max(1, bottom - top)
-            except Exception:
-                # 旧 Pillow 兜底
-                text_w, text_h = drawer.textsize(text, font=font)
+            # 背景色按图片的通道顺序给出
+            if return_rgb:
+                bg_color = (int(bg_bgr[2]), int(bg_bgr[1]), int(bg_bgr[0]))
+            else:
+                bg_color = (int(bg_bgr[0]), int(bg_bgr[1]), int(bg_bgr[2]))
+            sprite = self._label_sprite(text, bg_color)
+            label_h, label_w = sprite.shape[:2]
 
             # 计算放置位置：优先放在框上方，放不下则放在框下方
-            tx = max(0, min(x1, image_width - text_w - 8))
-            ty = y1 - text_h - 8
+            tx = max(0, min(x1, image_width - label_w + 1))
+            ty = y1 - label_h - 1
             if ty < 0:
-                ty = min(y2 + 2, max(0, image_height - text_h - 6))
+                ty = min(y2 + 2, max(0, image_height - label_h + 1))
 
-            # 背景矩形
-            box_x1 = tx
-            box_y1 = ty
-            box_x2 = min(image_width - 1, tx + text_w + 8)
-            box_y2 = min(image_height - 1, ty + text_h + 6)
+            # 超出图片的部分裁掉
+            h = min(label_h, image_height - ty)
+            w = min(label_w, image_width - tx)
+            if h <= 0 or w <= 0:
+                continue
+            image[ty:ty + h, tx:tx + w] = sprite[:h, :w]
 
-            # 颜色转换 BGR -> RGB
-            bg_rgb = (int(bg_bgr[2]), int(bg_bgr[1]), int(bg_bgr[0]))
-
-            drawer.rectangle([(box_x1, box_y1), (box_x2, box_y2)], fill=bg_rgb)
-            drawer.text((tx + 4, ty + 3), text, fill=(255, 255, 255), font=font)
-
-        # PIL(RGB) -> OpenCV(BGR)
-        return cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+        return image
     
     def load_database(self):
         """
@@ -219,136 +590,659 @@ class YOLOFaceRecognizer:
         
         try:
             # 打开并读取数据库文件
-            with open(self.db_path, 'rb') as f:
-                data = pickle.load(f)  # 读取保存的数据
-                self.known_face_encodings = data.get('encodings', [])  # 获取人脸特征
-                self.known_face_names = data.get('names', [])  # 获取人脸名字
+            # 数据库里存的是单位向量和各自原来的长度，相乘还原为原始特征 (N, 128) float32 矩阵
+            # 支持 pickle、.npy 和 .npz 格式
+            unit_encodings, norms, names = face_database.read_database_file(self.db_path)
+            self._set_known_faces(unit_encodings, norms, names, persist=True)
+            if face_database.needs_upgrade(self.db_path):
+                # 识别器只读数据库，不会改动文件；旧版格式提示用户重新保存一次
+                print(f" 提示：数据库是旧版格式，读取较慢；运行 python face_database.py --db {self.db_path} repack 升级一次即可")
             
             print(f" 成功加载了 {len(self.known_face_names)} 张人脸数据")
             return True
         except Exception as e:
             print(f" 加载数据库时出错：{e}")
             return False
+
+    def reload_database(self, database=None):
+        """
+        【重新加载人脸数据】
+        数据库改动后调用，让识别器用上最新的人脸数据（并重建比对索引）
+        传入 FaceDatabase 对象时直接使用它内存里的数据，不用再读一遍文件
+        """
+        if database is None:
+            return self.load_database()
+        self._set_known_faces(database.face_encodings, database.face_norms, database.face_names)
+        print(f" 已更新人脸数据，共 {len(self.known_face_names)} 张人脸")
+        return True
+
+    def _set_known_faces(self, unit_encodings: np.ndarray, norms: np.ndarray, names: List[str],
+                         persist: bool = False) -> None:
+        """
+        设置已知人脸并建立比对索引
+        数据库里存的是单位向量和各自原来的长度：单位向量用来建内积索引，
+        长度用来还原精确的欧氏距离（0.6 的阈值是按原始特征的欧氏距离定的）
+        persist=True 时（从文件加载）优先读取保存在数据库旁边的索引文件，没有或过期时重建并保存
+        """
+        unit_encodings = np.ascontiguousarray(unit_encodings, dtype=np.float32)
+        norms = np.ascontiguousarray(norms, dtype=np.float32).reshape(-1)
+        gpu_gallery = None
+        if self.db_device is not None:
+            # 特征放在 GPU 上直接做矩阵乘法，不需要 faiss 索引
+            face_index = None
+            gpu_gallery = self._build_gpu_gallery(unit_encodings)
+        elif persist:
+            face_index = self._load_or_build_face_index(unit_encodings)
+        else:
+            face_index = self._build_face_index(unit_encodings)
+        # 先建好索引再一起替换，摄像头线程不会看到一半新一半旧的数据
+        self.face_index = None
+        self._gpu_gallery = gpu_gallery
+        self.known_unit_encodings = unit_encodings
+        self.known_face_norms = norms
+        self._known_norms_sq = norms * norms
+        self.known_face_encodings = unit_encodings * norms[:, None]  # 原始特征 (N, 128)
+        self.known_face_names = list(names)
+        self.face_index = face_index
+        self._crop_cache.clear()  # 数据库变了，缓存的识别结果作废
+        self._tracks = []
+
+    def _resolve_db_device(self, db_device: Optional[str]) -> Optional[str]:
+        """检查 db_device 是否可用；没有 PyTorch 或 CUDA 时退回 CPU 比对（返回 None）"""
+        if db_device in (None, '', 'cpu'):
+            return None
+        if torch is None or not torch.cuda.is_available():
+            print(f" 提示：没有可用的 CUDA，数据库特征留在 CPU 上比对（--db-device {db_device} 无效）")
+            return None
+        return str(db_device)
+
+    def _build_gpu_gallery(self, unit_encodings: np.ndarray):
+        """把数据库特征按 db_dtype 放到 GPU 上，返回 (特征矩阵, 每行缩放比例或 None)"""
+        if self.db_dtype == 'fp16':
+            return torch.from_numpy(unit_encodings).to(self.db_device, dtype=torch.float16), None
+        # int8：每行按最大绝对值缩放到 [-127, 127]（和 face_database 的 int8 压缩相同），记下缩放比例
+        quantized = face_database.quantize_encodings(unit_encodings)
+        scales = np.abs(unit_encodings).max(axis=1) / 127.0 if len(unit_encodings) else np.empty(0)
+        # 整数矩阵乘法要求行数是 8 的倍数，末尾补几行 0（比对时不会用到）
+        padded = np.zeros((-(-len(quantized) // 8) * 8, quantized.shape[1]), dtype=np.int8)
+        padded[:len(quantized)] = quantized
+        return (torch.from_numpy(padded).to(self.db_device),
+                torch.from_numpy(scales.astype(np.float32)).to(self.db_device))
+
+    def _resolve_index_type(self, count: int) -> str:
+        """把 'auto' 换成具体的索引类型：人脸少时精确搜索，多了用 IVF"""
+        if self.index_type == 'auto':
+            return 'flat' if count < FLAT_INDEX_MAX else 'ivf'
+        return self.index_type
+
+    def _face_index_path(self, index_type: str) -> str:
+        """识别器索引文件的路径（按索引类型区分，不和 face_database 自己的 .faiss 文件冲突）"""
+        return f"{self.db_path}.{index_type}-{self.storage_precision}.faiss"
+
+    def _load_or_build_face_index(self, encodings: np.ndarray):
+        """
+        【读取或重建比对索引】
+        索引文件比数据库文件（和 .wal 追加日志）都新、条数也对得上时，直接用内存映射读取，
+        启动时不用再训练 IVF / 重新插入 HNSW；否则重建一次并保存，下次启动就快了
+        """
+        if faiss is None or len(encodings) == 0:
+            return None
+        index_type = self._resolve_index_type(len(encodings))
+        path = self._face_index_path(index_type)
+        index = self._read_face_index(path, len(encodings))
+        if index is None:
+            index = self._build_face_index(encodings, to_gpu=False)
+            try:
+                faiss.write_index(index, path)
+            except Exception as e:
+                print(f" 保存比对索引失败：{e}")
+        return self._index_to_gpu(index, index_type)
+
+    def _read_face_index(self, path: str, count: int):
+        """读取保存的索引文件；不存在、比数据库旧或条数不符时返回 None"""
+        if not os.path.exists(path):
+            return None
+        try:
+            index_mtime = os.path.getmtime(path)
+            db_mtimes = [os.path.getmtime(self.db_path)]
+            wal_path = face_database.wal_path_for(self.db_path)
+            if os.path.exists(wal_path):
+                db_mtimes.append(os.path.getmtime(wal_path))
+            if index_mtime < max(db_mtimes):
+                return None
+            try:
+                # 内存映射：向量数据按需从磁盘读入，多个进程可以共享同一份页缓存
+                index = faiss.read_index(path, faiss.IO_FLAG_MMAP)
+            except Exception:
+                # 部分索引类型不支持内存映射，改为普通读取
+                index = faiss.read_index(path)
+        except Exception as e:
+            print(f" 读取比对索引失败，将重新建立：{e}")
+            return None
+        if index.ntotal != count:
+            return None
+        return index
+
+    def _build_face_index(self, encodings: np.ndarray, to_gpu: bool = True):
+        """
+        在单位向量上建立 faiss 内积（余弦相似度）索引
+        - flat：精确搜索（IndexFlatIP，C++ 里用 SIMD 一次扫完所有特征），适合几千张脸以内
+        - ivf：先把特征分成若干聚类，搜索时只看最近的 IVF_NPROBE 个聚类，需要先训练一次
+        - hnsw：图索引，不用训练，边添加边可用
+        storage_precision 为 fp16 / int8 时，三种索引都换成对应的标量量化版本（int8 需要先训练取值范围）
+        没装 faiss 或数据库为空时返回 None，比对时回退到 NumPy 矩阵乘法
+        """
+        if faiss is None or len(encodings) == 0:
+            return None
+        count, dim = encodings.shape
+        index_type = self._resolve_index_type(count)
+        sq_type = {
+            'fp16': faiss.ScalarQuantizer.QT_fp16,
+            'int8': faiss.ScalarQuantizer.QT_8bit,
+        }.get(self.storage_precision)
+        metric = faiss.METRIC_INNER_PRODUCT
+
+        if index_type == 'ivf':
+            # 聚类数约为 4·√N（最多256个），每个聚类至少要有几十个训练样本
+            nlist = max(1, min(4 * int(np.sqrt(count)), 256, count // 39))
+            quantizer = faiss.IndexFlatIP(dim)
+            if sq_type is None:
+                index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+            else:
+                index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, sq_type, metric)
+            index.nprobe = min(IVF_NPROBE, nlist)
+        elif index_type == 'hnsw':
+            if sq_type is None:
+                index = faiss.IndexHNSWFlat(dim, HNSW_NEIGHBORS, metric)
+            else:
+                index = faiss.IndexHNSWSQ(dim, sq_type, HNSW_NEIGHBORS, metric)
+        elif sq_type is None:
+            index = faiss.IndexFlatIP(dim)
+        else:
+            index = faiss.IndexScalarQuantizer(dim, sq_type, metric)
+        if not index.is_trained:
+            index.train(encodings)
+        index.add(encodings)
+        if not to_gpu:
+            return index
+        return self._index_to_gpu(index, index_type)
+
+    def _index_to_gpu(self, index, index_type: str):
+        """
+        YOLO 在 GPU 上运行、并且装的是 GPU 版 faiss 时，把索引也搬到 GPU 上搜索
+        （HNSW 索引没有 GPU 版本，留在 CPU 上）
+        """
+        if index_type == 'hnsw' or self.yolo_device in ('cpu', 'mps'):
+            return index
+        try:
+            if not hasattr(faiss, 'StandardGpuResources') or faiss.get_num_gpus() == 0:
+                return index
+            if self._faiss_gpu is None:
+                self._faiss_gpu = faiss.StandardGpuResources()
+            return faiss.index_cpu_to_gpu(self._faiss_gpu, self._cuda_index(), index)
+        except Exception as e:
+            print(f" 无法把人脸索引放到GPU上，继续使用CPU：{e}")
+            return index
+
+    def _cuda_index(self) -> int:
+        """YOLO 所在 GPU 的编号（device 可能写成 0、'0'、'cuda' 或 'cuda:1'）"""
+        gpu_id = str(self.yolo_device).replace('cuda:', '').replace('cuda', '0')
+        return int(gpu_id) if gpu_id.isdigit() else 0
+
+    def _match_faces(self, face_encodings) -> List:
+        """
+        在数据库中找到和每张脸最像的人脸（一批特征一起比对）
+        先把查询特征归一化，用 faiss 内积索引（余弦相似度）一次取出每张脸的几个候选，
+        再用 |a-b|² = |a|² + |b|² - 2|a||b|·cos 算出候选的精确欧氏距离平方
+        （没装 faiss 时用同一个公式，一次矩阵乘法算出每张脸和所有人脸的距离；
+        数据库不大且装了 numba 时直接逐个相减算距离，见 _nearest_faces；
+        设置了 db_device 时在 GPU 上用 FP16 矩阵乘法取候选，代替 faiss）
+        返回每张脸一个 (数据库中的下标, 欧氏距离的平方)；数据库为空时是 (None, None)
+        """
+        if len(face_encodings) == 0:
+            return []
+        count = len(self.known_face_names)
+        if count == 0:
+            return [(None, None)] * len(face_encodings)
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, 128)
+        gpu_gallery = self._gpu_gallery
+        if (gpu_gallery is None and self.face_index is None
+                and _nearest_faces is not None and count < NUMBA_MAX_FACES):
+            # 数据库不大：直接用 numba 编译的循环算精确的欧氏距离
+            best_ids, best_distances = _nearest_faces(self.known_face_encodings, queries)
+            return [(int(i), float(d)) for i, d in zip(best_ids, best_distances)]
+        query_norms = np.linalg.norm(queries, axis=1)
+        unit_queries = queries / (query_norms[:, None] + 1e-12)
+
+        if gpu_gallery is not None:
+            # GPU 上一次矩阵乘法算出 (脸数, 数据库人数) 的余弦相似度，每张脸取 k 个候选
+            k = min(MATCH_CANDIDATES, count)
+            gallery, scales = gpu_gallery
+            if scales is None:
+                gpu_queries = torch.from_numpy(unit_queries).to(gallery.device, dtype=torch.float16)
+                scores = gpu_queries @ gallery.T
+            else:
+                # int8：查询也压缩成 int8 做整数矩阵乘法（int32 累加），再乘上数据库每行的缩放比例
+                # （查询自己的缩放比例对同一张脸的所有候选都一样，不影响排序，不用乘）
+                rows = len(unit_queries)
+                quantized = np.zeros((max(rows, 17), unit_queries.shape[1]), dtype=np.int8)
+                quantized[:rows] = face_database.quantize_encodings(unit_queries)  # 至少要 17 行
+                products = torch._int_mm(torch.from_numpy(quantized).to(gallery.device), gallery.T)
+                scores = products[:rows, :count].float() * scales
+            ids = torch.topk(scores, k, dim=1).indices.cpu().numpy()
+            # GPU 上算的相似度是近似值，候选用原始精度的特征重新算一遍
+            similarities = np.einsum('qkd,qd->qk', self.known_unit_encodings[ids], unit_queries)
+            norms = self.known_face_norms[ids]
+            norms_sq = norms * norms
+            valid = None
+        elif self.face_index is None:
+            # 没有 faiss：一次矩阵乘法（BLAS）算出 (脸数, 数据库人数) 的余弦相似度，所有人脸都是候选
+            similarities = unit_queries @ self.known_unit_encodings.T
+            ids = None
+            norms = self.known_face_norms[None, :]
+            norms_sq = self._known_norms_sq[None, :]
+            valid = None
+        else:
+            # faiss 一次搜索所有的脸，每张脸取 k 个候选 (脸数, k)
+            k = min(MATCH_CANDIDATES, count)
+            similarities, ids = self.face_index.search(unit_queries, k)
+            valid = ids >= 0  # 近似索引找不够 k 个时用 -1 补位
+            ids = np.where(valid, ids, 0)
+            if self.storage_precision != 'fp32':
+                # 量化索引给出的相似度是近似值，用原始精度的特征重新算一遍这些候选
+                similarities = np.einsum('qkd,qd->qk', self.known_unit_encodings[ids], unit_queries)
+            norms = self.known_face_norms[ids]
+            norms_sq = norms * norms
+
+        # 所有脸的所有候选一起换算成欧氏距离平方，再按行找出最小的
+        squared_distances = (norms_sq + (query_norms * query_norms)[:, None]
+                             - 2.0 * query_norms[:, None] * norms * similarities)
+        if valid is not None:
+            squared_distances = np.where(valid, squared_distances, np.inf)
+        best = np.argmin(squared_distances, axis=1)  # 找到最小值的位置
+        rows = np.arange(len(best))
+        best_distances = squared_distances[rows, best]
+        best_ids = best if ids is None else ids[rows, best]
+        return [(int(i), max(float(d), 0.0)) if np.isfinite(d) else (None, None)
+                for i, d in zip(best_ids, best_distances)]
     
-    def recognize_faces_in_frame(self, frame):
+    def _detect_faces_batch(self, frames: List[np.ndarray], rgb_frames: List[np.ndarray],
+                            detect_scale: float = 1.0) -> List[List]:
+        """
+        【找出多张图片中所有人脸的位置】
+        - detector='hog'：直接用 dlib 的 HOG 人脸检测（CPU 上对普通分辨率往往比 YOLO 还快）
+        - 人脸专用 YOLO 模型（如 yolov8n-face.pt）：YOLO 的框就是人脸的位置
+        - 通用 YOLO 模型（如 yolov8n.pt）：只保留"人"的框，再在框里用 HOG 找出脸的精确位置
+        用 YOLO 时所有图片放在一起，一次送进模型（GPU 上比一张一张送快很多）
+
+        返回值：
+            每张图片一个列表，每项是 (信心值, 位置框 (x1, y1, x2, y2), 人脸在整张图中的位置 (上, 右, 下, 左) 或 None)
+        """
+        if self.detector == 'hog':
+            return [self._hog_detections(rgb_frame, detect_scale) for rgb_frame in rgb_frames]
+
+        # 使用YOLO检测，就像用放大镜在照片上找所有的脸
+        # 锁页内存方式只按 yolo_imgsz 缩放，要求再缩小（detect_scale）时走下面的默认方式
+        if self._pinned_input and detect_scale == 1.0:
+            try:
+                prepared = self._pinned_yolo_input(frames)
+            except Exception as e:
+                print(f" 无法使用锁页内存传输画面，改用默认方式：{e}")
+                self._pinned_input = False
+                prepared = None
+            if prepared is not None:
+                batch, gain = prepared
+                # 框的坐标是缩放后画面里的坐标，除以缩放比例换算回原图
+                return [self._yolo_detections(data, rgb_frame, gain)
+                        for data, rgb_frame in zip(self._infer_tensor(batch), rgb_frames)]
+
+        # YOLO 反正会把图片缩小到 yolo_imgsz，比它大的图片在这里先缩小一次再送进去（检测结果一样），
+        # 不用把整张大图复制、上传给模型；框按各自的缩放比例换算回原图，提取特征仍然用原图
+        scales = [min(detect_scale, self.yolo_imgsz / max(frame.shape[:2])) for frame in frames]
+        detect_frames = [frame if scale == 1.0 else
+                         cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                         for frame, scale in zip(frames, scales)]
+        yolo_results = self.yolo_model(
+            detect_frames,
+            verbose=False,
+            device=self.yolo_device,
+            half=self.yolo_half,
+            imgsz=self.yolo_imgsz,
+            conf=self.confidence,  # 和 _yolo_detections 的筛选一致（Ultralytics 默认只保留 0.25 以上的框）
+            classes=self._yolo_classes,
+        )
+        return [self._yolo_detections(result.boxes.data, rgb_frame, scale)
+                for result, rgb_frame, scale in zip(yolo_results, rgb_frames, scales)]
+
+    def _infer_tensor(self, batch) -> List:
+        """
+        对 GPU 上已经准备好的输入做推理，返回每张图片的检测结果 (n, 6)：x1, y1, x2, y2, 信心值, 类别
+        第一次通过 Ultralytics 推理（让它准备好网络）；之后直接调用网络再做 NMS，
+        不走 Ultralytics 的后处理——它会把整批输入图片复制回 CPU 当作原图，白白多一次 GPU->CPU 传输
+        """
+        predictor = getattr(self.yolo_model, 'predictor', None)
+        if predictor is None:
+            yolo_results = self.yolo_model(batch, verbose=False, device=self.yolo_device, half=self.yolo_half,
+                                           conf=self.confidence, classes=self._yolo_classes)
+            return [result.boxes.data for result in yolo_results]
+        if self._nms is None:
+            try:
+                from ultralytics.utils.nms import non_max_suppression
+            except ImportError:
+                from ultralytics.utils.ops import non_max_suppression
+            self._nms = non_max_suppression
+        with torch.inference_mode():
+            preds = predictor.model(batch)
+        return self._nms(preds, self.confidence, predictor.args.iou, classes=self._yolo_classes,
+                         max_det=predictor.args.max_det)
+
+    def _pinned_yolo_input(self, frames: List[np.ndarray]):
+        """
+        【把一批画面经过锁页内存一次传到 GPU】
+        画面缩放到 YOLO 输入尺寸后写进一块固定的锁页（pinned）内存，再异步复制到 GPU；
+        缓冲区一直复用，不用每帧重新分配，BGR->RGB、HWC->CHW 和除以255也都在 GPU 上完成
+        （相当于 Ultralytics 自己做的预处理，只是少了每帧的内存分配和一次整帧复制）
+        复制走单独的 CUDA 流，每缩放好一帧就开始复制这一帧，CPU 缩放下一帧的同时上一帧在传输
+
+        缓冲区按 MAX_BATCH 张分配，批量变化（预热 1 张、摄像头一批几张）时只用前面几张，不重新分配
+
+        返回值：
+            (GPU 上的 (批量, 3, 高, 宽) 输入, 缩放比例)；画面大小不一致或超过 MAX_BATCH 张时返回 None
+        """
+        h, w = frames[0].shape[:2]
+        if len(frames) > MAX_BATCH or any(frame.shape != frames[0].shape for frame in frames):
+            return None
+        gain = min(self.yolo_imgsz / h, self.yolo_imgsz / w)
+        new_w, new_h = int(round(w * gain)), int(round(h * gain))
+        # 宽高补齐到 32 的倍数（YOLO 的步长）；只在右边和下边补灰色，框的坐标不用平移
+        pad_w, pad_h = -(-new_w // 32) * 32, -(-new_h // 32) * 32
+        key = (pad_h, pad_w)
+        device = torch.device('cuda', self._cuda_index())
+        if self._pinned_key != key:
+            self._pinned_host = torch.full((MAX_BATCH, pad_h, pad_w, 3), 114, dtype=torch.uint8).pin_memory()
+            self._pinned_device = torch.empty(self._pinned_host.shape, dtype=torch.uint8, device=device)
+            self._pinned_key = key
+        if self._copy_stream is None:
+            self._copy_stream = torch.cuda.Stream(device=device)
+        host = self._pinned_host.numpy()  # 和锁页内存共用同一块数据
+        # 上一批的复制和推理在拿到检测结果时都已经完成，这里可以直接覆盖两块缓冲区
+        with torch.cuda.stream(self._copy_stream):
+            for i, frame in enumerate(frames):
+                host[i, :new_h, :new_w] = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+                self._pinned_device[i].copy_(self._pinned_host[i], non_blocking=True)
+        # 推理所在的流等复制流传完再开始
+        torch.cuda.current_stream(device).wait_stream(self._copy_stream)
+        batch = self._pinned_device[:len(frames)].permute(0, 3, 1, 2).flip(1)  # (批量, 3, 高, 宽)，BGR -> RGB
+        batch = batch.half() if self.yolo_half else batch.float()
+        # 画面本来就是 (批量, 高, 宽, 3) 排列，channels_last 时不用再重排数据
+        memory_format = torch.channels_last if self.channels_last else torch.contiguous_format
+        return batch.div_(255.0).contiguous(memory_format=memory_format), gain
+
+    def _hog_detections(self, rgb_frame: np.ndarray, detect_scale: float) -> List:
+        """用 dlib HOG 检测一张图片中的人脸（见 _detect_faces_batch）"""
+        h, w = rgb_frame.shape[:2]
+        detect_rgb = rgb_frame
+        if detect_scale != 1.0:
+            detect_rgb = cv2.resize(rgb_frame, None, fx=detect_scale, fy=detect_scale,
+                                    interpolation=cv2.INTER_AREA)
+        detections = []
+        for top, right, bottom, left in face_recognition.face_locations(detect_rgb, model='hog'):
+            top, right = int(top / detect_scale), min(w, int(right / detect_scale))
+            bottom, left = min(h, int(bottom / detect_scale)), int(left / detect_scale)
+            detections.append((1.0, (left, top, right, bottom), (top, right, bottom, left)))
+        return detections
+
+    def _yolo_detections(self, boxes_data, rgb_frame: np.ndarray, detect_scale: float) -> List:
+        """
+        把一张图片的 YOLO 检测结果整理成人脸位置（见 _detect_faces_batch）
+        boxes_data: 所有框的数据（Ultralytics 结果的 boxes.data 或 NMS 的输出），
+                    每行 x1, y1, x2, y2, 信心值, 类别
+        """
+        h, w = rgb_frame.shape[:2]  # 获取图片的高度和宽度
+        detections = []
+        if len(boxes_data) == 0:
+            return detections
+        
+        # 一次取出所有框的坐标、信心值和类别（(x1, y1)是左上角，(x2, y2)是右下角）：
+        # 只从 GPU 复制一次，不用坐标、信心值、类别各等一次 GPU
+        # 下面的筛选和裁剪都用 NumPy 对所有框一起做，不用一个框一个框地处理
+        data = boxes_data.cpu().numpy().reshape(-1, boxes_data.shape[-1])
+        confs = data[:, -2].astype(np.float32)  # 带跟踪编号时编号在坐标后面，信心值和类别总是最后两列
+        classes = data[:, -1].astype(np.int64)
+        xyxy = (data[:, :4] / detect_scale).astype(np.int32)
+        
+        # 信心值太低，或者不是我们要的类别（人脸/人）的框不要
+        # 就像："这个不太像脸，算了，不管它"
+        keep = (confs >= self.confidence) & np.isin(classes, list(self.target_classes))
+        confs, xyxy = confs[keep], xyxy[keep]
+        
+        # 确保坐标不超出图片边界（防止框跑到图片外面去了）
+        np.clip(xyxy[:, 0::2], 0, w, out=xyxy[:, 0::2])
+        np.clip(xyxy[:, 1::2], 0, h, out=xyxy[:, 1::2])
+        
+        # 去掉无效（空的）框
+        box_w = xyxy[:, 2] - xyxy[:, 0]
+        box_h = xyxy[:, 3] - xyxy[:, 1]
+        valid = (box_w > 0) & (box_h > 0)
+        confs, xyxy, box_w, box_h = confs[valid], xyxy[valid], box_w[valid], box_h[valid]
+        
+        # 太小的框（远处的人）提取不出可用的特征，不用浪费时间，直接标为未知
+        unusable = (box_w < MIN_FACE_SIZE) | (box_h < MIN_FACE_SIZE)
+        if self.is_face_model:
+            # 形状明显不像脸（太扁或太长）的框也跳过
+            aspect = box_w / box_h
+            unusable |= ~((aspect > FACE_ASPECT_RANGE[0]) & (aspect < FACE_ASPECT_RANGE[1]))
+        
+        # 一次换成 Python 的数字（tolist），不用每个框每个坐标单独转换
+        confs, boxes, unusable = confs.tolist(), xyxy.tolist(), unusable.tolist()
+        if self.is_face_model:
+            # 人脸专用模型：框就是脸，不需要再逐个处理
+            return [(conf, (x1, y1, x2, y2), None if skip else (y1, x2, y2, x1))
+                    for conf, (x1, y1, x2, y2), skip in zip(confs, boxes, unusable)]
+        
+        # 通用模型：只剩下留下来的框需要逐个处理
+        for conf, (x1, y1, x2, y2), skip in zip(confs, boxes, unusable):
+            if skip:
+                detections.append((conf, (x1, y1, x2, y2), None))
+                continue
+            
+            # 通用模型的框是整个人：在框里找到脸的精确位置，换算成整张图里的坐标
+            face_region = np.ascontiguousarray(rgb_frame[y1:y2, x1:x2])
+            face_locations = face_recognition.face_locations(face_region)
+            if len(face_locations) == 0:
+                detections.append((conf, (x1, y1, x2, y2), None))
+                continue
+            top, right, bottom, left = face_locations[0]  # 使用第一张脸
+            detections.append((conf, (x1, y1, x2, y2),
+                               (top + y1, right + x1, bottom + y1, left + x1)))
+        return detections
+    
+    def recognize_faces_in_frame(self, frame, detect_scale: float = 1.0, use_cache: bool = False,
+                                 use_tracking: bool = False):
         """
         【在一帧图像中检测和识别人脸】
         这是核心功能！分为两步：
-        1. 用YOLO找出图片中所有人脸的位置
+        1. 用YOLO（或HOG）找出图片中所有人脸的位置
         2. 识别每张脸是谁
         
         参数说明：
-            frame: 一张图片（BGR格式，来自OpenCV）
+            frame: 一张图片（BGR格式，来自OpenCV；只读取，不会修改它）
+            detect_scale: 检测人脸前先把图片缩放到这个比例（例如0.5表示缩小一半，检测快很多）
+                          检测到的框会换算回原图坐标，提取特征仍然使用原图，不影响识别准确度
+            use_cache: 摄像头连续画面用：同一张脸在短时间内直接沿用上次的识别结果（见 CROP_CACHE_TTL）
+            use_tracking: 摄像头连续画面用：和上一帧人脸框重叠的脸直接沿用上一帧的名字（见 TRACK_IOU_THRESHOLD）
             
         返回值：
             结果列表，每个结果包含：(名字, 信心值, 位置框)
             例如：[("小明", 0.85, (100, 100, 200, 200)), ...]
             位置框是 (左上角x, 左上角y, 右下角x, 右下角y)
         """
-        results = []  # 创建空列表，用来存放识别结果
+        return self.recognize_faces_in_frames([frame], detect_scale, use_cache, use_tracking)[0]
+
+    def recognize_faces_in_frames(self, frames: List[np.ndarray], detect_scale: float = 1.0,
+                                  use_cache: bool = False, use_tracking: bool = False) -> List[List]:
+        """
+        【一次识别多张图片】
+        和 recognize_faces_in_frame 一样，但所有图片一起送进 YOLO 做一次批量推理
+        处理一批照片时比一张一张调用快（GPU 上尤其明显）
+        跟踪时这一批图片都和上一批最后一帧的人脸框配对，识别完再用这一批最后一帧的结果更新
+
+        返回值：
+            每张图片一个结果列表（格式见 recognize_faces_in_frame）
+        """
+        if not frames:
+            return []
+        # 每帧只转换一次颜色格式（OpenCV用BGR，face_recognition用RGB）
+        rgb_frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in frames]
         
-        # 【第1步】使用YOLO检测人脸位置
-        # 就像用放大镜在照片上找所有的脸
-        yolo_results = self.yolo_model(
-            frame,
-            verbose=False,
-            device=self.yolo_device,
-            half=self.yolo_half,
-        )
+        # 【第1步】找出图片中所有人脸的位置
+        all_detections = self._detect_faces_batch(frames, rgb_frames, detect_scale)
+        
+        # 先查缓存：同一张脸刚刚识别过，就不用再提取特征了
+        now = time.monotonic()
+        all_crop_keys = []  # 每张图片：检测框序号 -> 人脸小图哈希
+        all_cached = []  # 每张图片：检测框序号 -> 缓存的 (名字, 信心值)
+        track_times = {}  # 最后一张图片：沿用上一帧名字的检测框序号 -> 当初识别的时间
+        for rgb_frame, detections in zip(rgb_frames, all_detections):
+            crop_keys, cached = {}, {}
+            if use_tracking:
+                tracked = self._match_tracks(detections, now)
+                cached = {i: (name, confidence) for i, (name, confidence, _) in tracked.items()}
+                track_times = {i: recognized_at for i, (_, _, recognized_at) in tracked.items()}
+            if use_cache:
+                for i, (_, _, location) in enumerate(detections):
+                    if location is None or i in cached:
+                        continue
+                    crop_keys[i] = self._crop_hash(rgb_frame, location)
+                    hit = self._lookup_crop_cache(crop_keys[i], now)
+                    if hit is not None:
+                        cached[i] = hit
+            all_crop_keys.append(crop_keys)
+            all_cached.append(cached)
+        
+        # 【第2步】一次性提取所有图片里所有人脸的特征编码
+        # 就像给每张脸生成一个独特的"指纹"；所有脸在一次 dlib 调用里算完，不用每张脸调用一次
+        face_locations = [[location for i, (_, _, location) in enumerate(detections)
+                           if location is not None and i not in cached]
+                          for detections, cached in zip(all_detections, all_cached)]
+        face_encodings = [encoding for frame_encodings in face_database.encode_faces(rgb_frames, face_locations)
+                          for encoding in frame_encodings]
+        
+        # 【第3步】所有特征一起和数据库中的人脸进行比对
+        matches = iter(self._match_faces(face_encodings))
+        
+        all_results = [self._collect_results(detections, crop_keys, cached, matches, now)
+                       for detections, crop_keys, cached in zip(all_detections, all_crop_keys, all_cached)]
+        if use_tracking:
+            # 记住最后一帧的人脸，下一帧和它们配对（只记提取到人脸的框）
+            self._tracks = [(bbox, name, confidence, track_times.get(i, now))
+                            for i, ((_, _, location), (name, confidence, bbox))
+                            in enumerate(zip(all_detections[-1], all_results[-1])) if location is not None]
+        return all_results
+
+    def _match_tracks(self, detections: List, now: float) -> Dict:
+        """
+        把检测框和上一帧的人脸框按重叠程度（IoU）配对，重叠够多的认为是同一个人
+        返回 检测框序号 -> (名字, 信心值, 识别时间)；识别超过 TRACK_REFRESH 秒的脸不配对，重新识别
+        """
+        tracks = [track for track in self._tracks if now - track[3] <= TRACK_REFRESH]
+        indices = [i for i, (_, _, location) in enumerate(detections) if location is not None]
+        if not tracks or not indices:
+            return {}
+        iou = _box_iou(np.array([detections[i][1] for i in indices], dtype=np.float32),
+                       np.array([track[0] for track in tracks], dtype=np.float32))
+        tracked = {}
+        for row, i in enumerate(indices):
+            best = int(np.argmax(iou[row]))
+            if iou[row, best] > TRACK_IOU_THRESHOLD:
+                _, name, confidence, recognized_at = tracks[best]
+                tracked[i] = (name, confidence, recognized_at)
+                iou[:, best] = -1  # 一个旧的人脸框只能配给一个检测框
+        return tracked
+
+    def _collect_results(self, detections: List, crop_keys: Dict, cached: Dict, matches, now: float) -> List:
+        """按检测框的顺序整理一张图片的识别结果（matches 依次给出需要比对的每张脸的比对结果）"""
+        results = []  # 创建空列表，用来存放识别结果
         
-        # 【第2步】处理每个检测到的人脸
-        for result in yolo_results:
-            boxes = result.boxes  # 获取所有检测到的框
+        for i, (conf, bbox, location) in enumerate(detections):
+            # 如果框里没有找到脸，标记为"未知"
+            if location is None:
+                results.append(("未知", conf, bbox))
+                continue
+            if i in cached:
+                name, best_match_confidence = cached[i]
+                results.append((name, best_match_confidence, bbox))
+                continue
             
-            # 遍历每个检测到的框（每个框代表一张可能的脸）
-            for box in boxes:
-                # 获取这个框的信心值（YOLO有多确定这是一张脸）
-                conf = float(box.conf[0])
-                cls = int(box.cls[0])  # 获取类别（通常是"人脸"类别）
-                
-                # 如果信心值太低，跳过这个框
-                # 就像："这个不太像脸，算了，不管它"
-                if conf < self.confidence:
-                    continue
-                
-                # 获取框的四个角的坐标
-                # (x1, y1)是左上角，(x2, y2)是右下角
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                
-                # 确保坐标不超出图片边界
-                # 防止框跑到图片外面去了
-                h, w = frame.shape[:2]  # 获取图片的高度和宽度
-                x1, y1 = max(0, x1), max(0, y1)  # 左上角不能是负数
-                x2, y2 = min(w, x2), min(h, y2)  # 右下角不能超过图片大小
-                
-                # 从图片中裁剪出人脸区域
-                # 就像用剪刀把照片中的脸剪下来
-                face_region = frame[y1:y2, x1:x2]
-                
-                # 检查裁剪的区域是否有效（不是空的）
-                if face_region.size == 0:
-                    continue
-                
-                # 【第3步】识别这张脸是谁
-                
-                # 将颜色格式从BGR转换为RGB
-                # （OpenCV用BGR，face_recognition用RGB，需要转换）
-                rgb_face = cv2.cvtColor(face_region, cv2.COLOR_BGR2RGB)
-                
-                # 提取这张脸的特征编码
-                # 就像给这张脸生成一个独特的"指纹"
-                face_encodings = face_recognition.face_encodings(rgb_face)
-                
-                # 如果没有提取到特征，标记为"未知"
-                if len(face_encodings) == 0:
-                    results.append(("未知", conf, (x1, y1, x2, y2)))
-                    continue
-                
-                face_encoding = face_encodings[0]  # 使用第一个特征
-                
-                # 【第4步】和数据库中的人脸进行比对
-                name = "未知"  # 默认是未知
-                best_match_confidence = 0.0  # 最佳匹配的信心值
-                
-                # 如果数据库中有保存的人脸数据
-                if len(self.known_face_encodings) > 0:
-                    # 计算当前人脸和数据库中所有人脸的距离
-                    # 距离越小，说明越相似
-                    # 就像比较两个人长得有多像
-                    face_distances = face_recognition.face_distance(
-                        self.known_face_encodings, face_encoding
-                    )
-                    
-                    # 找到距离最小的（最相似的）人脸
-                    best_match_idx = np.argmin(face_distances)  # 找到最小值的位置
-                    best_distance = face_distances[best_match_idx]  # 最小的距离
-                    
-                    # 将距离转换为信心值（距离小 = 信心高）
-                    # 0.6是经验阈值：距离小于0.6认为是同一个人
-                    match_confidence = 1 - best_distance
-                    
-                    # 如果距离足够小，认为识别成功
-                    if best_distance < 0.6:
-                        name = self.known_face_names[best_match_idx]  # 获取这个人的名字
-                        best_match_confidence = match_confidence
-                
-                # 把识别结果添加到结果列表
-                results.append((name, best_match_confidence, (x1, y1, x2, y2)))
+            name = "未知"  # 默认是未知
+            best_match_confidence = 0.0  # 最佳匹配的信心值
+            
+            # 数据库中距离最小的（最相似的）人脸
+            # 距离越小，说明越相似，就像比较两个人长得有多像
+            best_match_idx, best_squared_distance = next(matches)
+            
+            # 如果距离足够小，认为识别成功
+            # 0.6是经验阈值：距离小于0.6认为是同一个人（直接比较距离的平方，省掉开方）
+            if best_match_idx is not None and best_squared_distance < MATCH_THRESHOLD ** 2:
+                name = self.known_face_names[best_match_idx]  # 获取这个人的名字
+                # 将距离转换为信心值（距离小 = 信心高）
+                best_match_confidence = 1.0 - float(np.sqrt(best_squared_distance))
+            
+            # 把识别结果添加到结果列表
+            results.append((name, best_match_confidence, bbox))
+            if crop_keys.get(i) is not None:
+                self._store_crop_cache(crop_keys[i], name, best_match_confidence, now)
         
         return results  # 返回所有识别结果
+
+    @staticmethod
+    def _crop_hash(rgb_frame: np.ndarray, location) -> Optional[bytes]:
+        """
+        计算人脸小图的 64 位感知哈希（8 个字节）
+        人脸缩小到 32x32 的灰度图后再算哈希，轻微的噪点和光线变化不会改变结果
+        """
+        top, right, bottom, left = location
+        crop = rgb_frame[max(top, 0):bottom, max(left, 0):right]
+        if crop.size == 0:
+            return None
+        gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+        small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA)
+        if _img_hash is not None:
+            return _img_hash.pHash(small).tobytes()
+        tiny = cv2.resize(small, (8, 8), interpolation=cv2.INTER_AREA)
+        return np.packbits(tiny > tiny.mean()).tobytes()
+
+    def _lookup_crop_cache(self, key: Optional[bytes], now: float):
+        """查缓存；没有或已经过期时返回 None，命中时返回 (名字, 信心值)"""
+        entry = self._crop_cache.get(key) if key is not None else None
+        if entry is None:
+            return None
+        if now - entry[2] > CROP_CACHE_TTL:
+            del self._crop_cache[key]
+            return None
+        self._crop_cache.move_to_end(key)
+        return entry[0], entry[1]
+
+    def _store_crop_cache(self, key: bytes, name: str, confidence: float, now: float) -> None:
+        """记住这张脸的识别结果，超过 CROP_CACHE_SIZE 时删掉最久没用的"""
+        self._crop_cache[key] = (name, confidence, now)
+        self._crop_cache.move_to_end(key)
+        while len(self._crop_cache) > CROP_CACHE_SIZE:
+            self._crop_cache.popitem(last=False)
     
-    def draw_results(self, frame, results):
+    def draw_results(self, frame, results, return_rgb=False):
         """
         【在图片上画出识别结果】
         在每张检测到的脸周围画一个框，并标注名字
         就像给照片做标记，圈出谁是谁
         
         参数说明：
-            frame: 原始图片
+            frame: 原始图片（框和标签直接画在这张图上；需要保留原图时先传入 frame.copy()）
             results: 识别结果列表
+            return_rgb: 为 True 时返回 RGB 图片（直接交给界面显示，不用再转换一次颜色）
             
         返回值：
-            画好标记的图片
+            画好标记的图片（默认 BGR 格式）
         """
         # 先画检测框，再统一用 Pillow 绘制中文标签，避免中文乱码
         label_tasks: List[Dict] = []
@@ -376,7 +1270,7 @@ class YOLOFaceRecognizer:
             })
 
         # 使用 Pillow 渲染中文标签
-        frame = self._draw_labels_pil(frame, label_tasks)
+        frame = self._draw_labels_pil(frame, label_tasks, return_rgb=return_rgb)
 
         return frame  # 返回画好的图片
     
@@ -402,9 +1296,8 @@ class YOLOFaceRecognizer:
         # 识别图片中的人脸
         results = self.recognize_faces_in_frame(frame)
         
-        # 在图片副本上画出识别结果
-        # 使用copy()是为了保留原图不变
-        output_frame = self.draw_results(frame.copy(), results)
+        # 画出识别结果（原图后面用不到了，直接画在上面，不用先复制一份）
+        output_frame = self.draw_results(frame, results)
         
         # 如果需要显示结果
         if show:
@@ -424,8 +1317,47 @@ class YOLOFaceRecognizer:
             print(f"  - {name}（信心值：{conf:.2f}）")
         
         return results
+
+    def process_images(self, image_paths, output_dir=None, batch_size=IMAGE_BATCH_SIZE):
+        """
+        【批量处理多张图片】
+        每 batch_size 张图片一起送进 YOLO 检测，比一张一张处理快
+        
+        参数说明：
+            image_paths: 输入图片路径列表
+            output_dir: 保存结果图片的文件夹（可选，文件名和输入图片相同）
+            batch_size: 每批处理的图片数量
+            
+        返回值：
+            字典：{图片路径: 识别结果列表}
+        """
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        all_results = {}
+        for start in range(0, len(image_paths), batch_size):
+            # 读取这一批图片（读不了的跳过）
+            paths, frames = [], []
+            for image_path in image_paths[start:start + batch_size]:
+                frame = cv2.imread(image_path)
+                if frame is None:
+                    print(f" 错误：无法读取图片 {image_path}")
+                    all_results[image_path] = []
+                    continue
+                paths.append(image_path)
+                frames.append(frame)
+            
+            # 整批一起识别
+            for image_path, frame, results in zip(paths, frames, self.recognize_faces_in_frames(frames)):
+                all_results[image_path] = results
+                if output_dir:
+                    output_path = os.path.join(output_dir, os.path.basename(image_path))
+                    cv2.imwrite(output_path, self.draw_results(frame, results))
+                names = '、'.join(f"{name}（{conf:.2f}）" for name, conf, _ in results) or '没有检测到人脸'
+                print(f" {image_path}：{names}")
+        return all_results
     
-    def process_camera(self, camera_id=0):
+    def process_camera(self, camera_id=0, csi=False, batch_size=CAMERA_BATCH_SIZE,
+                       skip_similar=False, skip_threshold=SKIP_SIMILAR_THRESHOLD, cap=None):
         """
         【处理摄像头实时视频】
         打开摄像头，实时识别视频中的人脸
@@ -433,36 +1365,127 @@ class YOLOFaceRecognizer:
         
         参数说明：
             camera_id: 摄像头设备编号（通常0是默认摄像头）
+            csi: 是否是 Jetson 的 CSI 摄像头（通过 GStreamer 读取，需要 OpenCV 带 GStreamer 支持）
+            batch_size: 攒够几帧画面一起处理（最多 MAX_BATCH，导出的推理引擎一次最多推理这么多张）；
+                        1 时每 TRACK_DETECT_INTERVAL 帧检测一次，大于 1 时每帧都检测、整批一次推理
+            skip_similar: 要检测的画面和上次检测的画面几乎一样时跳过检测，沿用上次的结果
+            skip_threshold: 两帧哈希相差不到这么多位就算几乎一样
+            cap: 已经打开并设置好格式的 cv2.VideoCapture（比如 open_usb_camera 的返回值）；
+                 不传时按 camera_id / csi 打开摄像头；传入的摄像头用完后同样会被释放
         """
         # 打开摄像头
-        cap = cv2.VideoCapture(camera_id)
+        if cap is None:
+            if csi:
+                cap = cv2.VideoCapture(jetson_csi_pipeline(camera_id), cv2.CAP_GSTREAMER)
+            else:
+                # USB 摄像头：MJPG 格式，驱动里只缓存 1 帧（默认会缓存好几帧，读到的画面要慢两三百毫秒）
+                cap = open_usb_camera(camera_id)
         
         # 检查摄像头是否成功打开
-        if not cap.isOpened():
+        if cap is None or not cap.isOpened():
             print(f" 错误：无法打开摄像头 {camera_id}")
             return
         
         print(" 摄像头已打开。按 'q' 键退出。")
         
-        # 处理视频帧（循环）
-        frame_count = 0  # 帧计数器
+        # 三个步骤同时进行，总速度只取决于最慢的那一步，而不是三步加起来：
+        #   读画面线程：不停读取摄像头画面，放进定长队列
+        #   识别线程：攒够一批画面后一起识别（一次 YOLO 推理），结果放进显示队列
+        #   主线程：画框并显示（OpenCV 的窗口只能在主线程里操作）
+        # 识别跟不上时，定长队列满了会自动丢掉最旧的画面，保证看到的总是最近的画面
+        # （用完整性换延迟：跟不上时中间的画面直接跳过，不会每一帧都识别）
+        # HOG 检测是一帧一帧做的，攒批没有好处，每帧都直接识别
+        # 一帧一帧处理时，每 TRACK_DETECT_INTERVAL 帧才检测一次，中间的帧直接画上次的框（人在几帧之间移动很小）；
+        # 攒批时一批里的每一帧都检测，整批一次送进 YOLO（否则一批里最多只有一帧要检测，攒批只会增加延迟）
+        batch_size = max(1, min(batch_size, MAX_BATCH)) if self.yolo_model is not None else 1
+        detect_interval = TRACK_DETECT_INTERVAL if batch_size == 1 else 1
+        if (torch is not None and self.yolo_device not in (None, 'cpu', 'mps')
+                and torch.cuda.is_available()):
+            # 摄像头画面大小固定，让 cuDNN 第一次推理时试出最快的卷积算法，之后一直用它
+            # （和画面走哪种输入方式无关，只要在 CUDA 上推理就开）
+            torch.backends.cudnn.benchmark = True
+        if self._pinned_capable:
+            # 按摄像头的画面大小和批量比较两种画面输入方式（驱动报不出画面大小时按默认大小）
+            height, width = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
+            self._choose_input_path((height, width) if height and width else WARMUP_FRAME_SHAPE, batch_size)
+        frames = deque(maxlen=batch_size)
+        frames_ready = threading.Condition()
+        results_queue = queue.Queue(maxsize=DISPLAY_QUEUE_SIZE)
+        stop_event = threading.Event()
+        
+        def read_frames():
+            while not stop_event.is_set():
+                # 读取一帧画面
+                ret, frame = cap.read()
+                if not ret:
+                    print(" 错误：无法读取摄像头画面")
+                    stop_event.set()
+                with frames_ready:
+                    if ret:
+                        frames.append(frame)
+                    frames_ready.notify()
+        
+        def send_to_display(item):
+            # 显示队列满了就等一等（要退出时不再等）
+            while not stop_event.is_set():
+                try:
+                    results_queue.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+        
+        def recognize_batches():
+            frame_count = 0
+            last_results = []  # 上次识别的结果，不检测的帧沿用它
+            last_hash = None  # 上次检测的画面的哈希（skip_similar 时用）
+            self._tracks = []
+            while not stop_event.is_set():
+                with frames_ready:
+                    frames_ready.wait_for(lambda: len(frames) >= batch_size or stop_event.is_set())
+                    batch = list(frames)
+                    frames.clear()
+                if not batch:
+                    break
+                detect = [k for k in range(len(batch)) if (frame_count + k) % detect_interval == 0]
+                frame_count += len(batch)
+                if skip_similar:
+                    # 和上次检测的画面几乎一样（哈希相差不到 skip_threshold 位）就不检测了
+                    kept = []
+                    for k in detect:
+                        frame_hash = _frame_hash(batch[k])
+                        if last_hash is not None and bin(frame_hash ^ last_hash).count('1') < skip_threshold:
+                            continue
+                        kept.append(k)
+                        last_hash = frame_hash
+                    detect = kept
+                first = detect[0] if detect else len(batch)
+                # 第一帧要检测的画面之前的画面不用等识别，先交给主线程显示（识别的同时主线程在画框、显示）
+                for frame in batch[:first]:
+                    send_to_display((frame, last_results))
+                # 这一批里需要检测的画面一起识别，再按顺序交给主线程显示
+                detected = {}
+                if detect:
+                    detected = dict(zip(detect, self.recognize_faces_in_frames(
+                        [batch[k] for k in detect], use_cache=True, use_tracking=True)))
+                for k in range(first, len(batch)):
+                    last_results = detected.get(k, last_results)
+                    send_to_display((batch[k], last_results))
+        
+        reader = threading.Thread(target=read_frames, daemon=True)
+        recognizer = threading.Thread(target=recognize_batches, daemon=True)
+        reader.start()
+        recognizer.start()
+        
+        # 显示识别好的画面（循环）
         while True:
-            # 读取一帧画面
-            ret, frame = cap.read()
-            if not ret:
-                print(" 错误：无法读取摄像头画面")
-                break
-            
-            # 每一帧都进行识别
-            # 注意：如果电脑太慢，可以改成每隔几帧识别一次
-            if frame_count % 1 == 0:  # 目前是每帧都识别
-                results = self.recognize_faces_in_frame(frame)
-                frame = self.draw_results(frame, results)
-            
-            frame_count += 1  # 帧计数加1
-            
-            # 显示画面
-            cv2.imshow('人脸识别（按q退出）', frame)
+            try:
+                frame, results = results_queue.get(timeout=0.1)
+            except queue.Empty:
+                if not recognizer.is_alive():
+                    break  # 摄像头读不到画面，识别线程已经停下
+                frame = None
+            if frame is not None:
+                cv2.imshow('人脸识别（按q退出）', self.draw_results(frame, results))
             
             # 检查是否按下了 'q' 键
             # waitKey(1) 表示等待1毫秒，如果按了键就返回该键的ASCII码
@@ -470,6 +1493,11 @@ class YOLOFaceRecognizer:
                 break
         
         # 清理工作
+        stop_event.set()
+        with frames_ready:
+            frames_ready.notify_all()
+        recognizer.join(timeout=1.0)
+        reader.join(timeout=1.0)  # 等读画面线程停下来再释放摄像头
         cap.release()  # 释放摄像头
         cv2.destroyAllWindows()  # 关闭所有窗口
         print(" 摄像头已关闭")
@@ -486,22 +1514,40 @@ def main():
     parser = argparse.ArgumentParser(description='YOLO人脸识别系统')
     parser.add_argument('--db', default='face_database.pkl', 
                        help='人脸数据库路径（默认：face_database.pkl）')
-    parser.add_argument('--model', default='yolov8n.pt', 
-                       help='YOLO模型路径（默认：yolov8n.pt）')
+    parser.add_argument('--model', default=DEFAULT_YOLO_MODEL, 
+                       help='YOLO模型路径（默认：有 yolov8n-face.pt 就用它，否则用 yolov8n.pt）')
+    parser.add_argument('--detector', default='yolo', choices=DETECTORS,
+                       help='人脸检测方式（默认：yolo；hog 不需要YOLO模型，CPU上很快）')
     parser.add_argument('--confidence', type=float, default=0.5, 
                        help='检测信心阈值（默认：0.5）')
     parser.add_argument('--device', default=None,
                        help='推理设备：如 0/cuda:0 或 cpu（默认自动检测）')
     parser.add_argument('--no-half', action='store_true',
-                       help='禁用半精度FP16（Jetson上如遇问题可加该参数）')
+                       help='禁用半精度FP16（默认在 CUDA GPU 上自动使用；Jetson上如遇问题可加该参数）')
+    parser.add_argument('--db-device', default=None,
+                       help='把人脸数据库放到 GPU 上比对，如 cuda 或 cuda:0（默认：在 CPU 上比对）')
+    parser.add_argument('--db-dtype', default='fp16', choices=DB_DTYPES,
+                       help='--db-device 时 GPU 上数据库特征的数据类型（默认：fp16；int8 数据量减半）')
+    parser.add_argument('--no-channels-last', action='store_true',
+                       help='不使用 channels_last 内存布局（默认在 CUDA + FP16 时自动使用）')
+    parser.add_argument('--index', default='auto', choices=INDEX_TYPES,
+                       help='人脸比对索引类型（默认：auto，数据库很大时自动使用 ivf）')
+    parser.add_argument('--backend', default='torch', choices=BACKENDS,
+                       help='YOLO 推理后端（默认：torch；trt 在 Jetson/GPU 上导出 TensorRT 引擎，openvino 适合只有CPU的电脑）')
+    parser.add_argument('--int8', action='store_true',
+                       help='导出推理引擎时使用 INT8 精度（默认：GPU 上用 FP16；需要同时给出 --int8-data）')
+    parser.add_argument('--int8-data',
+                       help='INT8 校准数据集（Ultralytics 数据集 yaml，图片用人脸画面）；没有时 --int8 改用 FP16')
+    parser.add_argument('--precision', default='fp32', choices=STORAGE_PRECISIONS,
+                       help='比对索引里特征的存储精度（默认：fp32；fp16/int8 占用内存更少，搜索更快）')
     
     # 创建子命令（两种模式）
     subparsers = parser.add_subparsers(dest='mode', help='识别模式')
     
     # 【模式1：图片识别】
     image_parser = subparsers.add_parser('image', help='处理图片文件')
-    image_parser.add_argument('input', help='输入图片路径')
-    image_parser.add_argument('--output', help='输出图片路径')
+    image_parser.add_argument('input', nargs='+', help='输入图片路径（可以给多张，或用 *.jpg 这样的通配符）')
+    image_parser.add_argument('--output', help='输出图片路径（多张图片时是保存结果的文件夹）')
     image_parser.add_argument('--no-show', action='store_true', 
                              help='不显示结果窗口')
     
@@ -509,6 +1555,15 @@ def main():
     camera_parser = subparsers.add_parser('camera', help='处理摄像头视频')
     camera_parser.add_argument('--camera-id', type=int, default=0, 
                               help='摄像头设备编号（默认：0）')
+    camera_parser.add_argument('--csi', action='store_true',
+                              help='Jetson CSI 摄像头（用 GStreamer 和硬件转换画面格式）')
+    camera_parser.add_argument('--batch', type=int, default=CAMERA_BATCH_SIZE,
+                              help=f'攒够几帧画面一起处理（默认：{CAMERA_BATCH_SIZE}，最多 {MAX_BATCH}；'
+                                   f'1 时每 {TRACK_DETECT_INTERVAL} 帧检测一次，大于 1 时每帧都检测、整批一次推理）')
+    camera_parser.add_argument('--skip-similar', action='store_true',
+                              help='画面几乎没变（比如人坐着不动）时跳过检测，沿用上次的结果')
+    camera_parser.add_argument('--skip-threshold', type=int, default=SKIP_SIMILAR_THRESHOLD,
+                              help=f'两帧画面哈希相差不到几位算几乎没变（默认：{SKIP_SIMILAR_THRESHOLD}，共 64 位）')
     
     # 解析命令行参数
     args = parser.parse_args()
@@ -524,21 +1579,36 @@ def main():
         yolo_model=args.model,
         confidence=args.confidence,
         device=args.device,
-        use_half=(not args.no_half)
+        use_half=(False if args.no_half else None),  # 默认自动：只在 CUDA 上用 FP16
+        channels_last=(False if args.no_channels_last else None),
+        db_device=args.db_device,
+        db_dtype=args.db_dtype,
+        index_type=args.index,
+        detector=args.detector,
+        storage_precision=args.precision,
+        backend=args.backend,
+        int8=args.int8,
+        int8_data=args.int8_data
     )
     
     # 根据模式执行相应操作
     if args.mode == 'image':
         # 图片识别模式
-        recognizer.process_image(
-            args.input,
-            output_path=args.output,
-            show=not args.no_show
-        )
+        image_paths = expand_image_paths(args.input)
+        if len(image_paths) == 1:
+            recognizer.process_image(
+                image_paths[0],
+                output_path=args.output,
+                show=not args.no_show
+            )
+        else:
+            # 多张图片：模型只加载一次，图片成批送进 YOLO
+            recognizer.process_images(image_paths, output_dir=args.output)
     
     elif args.mode == 'camera':
         # 摄像头识别模式
-        recognizer.process_camera(camera_id=args.camera_id)
+        recognizer.process_camera(camera_id=args.camera_id, csi=args.csi, batch_size=args.batch,
+                                  skip_similar=args.skip_similar, skip_threshold=args.skip_threshold)
 
 
 # 程序启动代码
@@ -0,0 +1,153 @@
+"""
+YOLO 模型导出与加载工具
+- 把 Ultralytics 的 .pt 模型导出为 TensorRT(.engine) 或 OpenVINO 推理引擎
+  （OpenVINO 模型保存在 .pt 文件旁边；TensorRT 引擎只能在构建它的 GPU 和软件版本上用，
+  按 GPU、CUDA/TensorRT 版本、输入尺寸和精度分别缓存在 ENGINE_CACHE_DIR 里）
+  （OpenVINO INT8 适合没有 GPU 的电脑，在 CPU 上利用 VNNI 整数指令加速）
+- 已经导出过的引擎直接加载，避免每次启动都重新构建（构建一次要好几分钟）
+- TensorRT 引擎把 NMS（去掉重叠框）也做进引擎里（EfficientNMS 插件），推理结果直接就是最终的框，
+  不用再在 Python/PyTorch 里做 NMS
+- 导出失败（例如没有 GPU 或没装 TensorRT）时回退到原始 .pt 模型，保证程序可用
+"""
+import hashlib
+import os
+import shutil
+from typing import Optional, Union
+
+# 支持的推理后端：'torch' 直接用 PyTorch 加载 .pt；'trt' 使用 TensorRT 引擎；
+# 'openvino' 使用 OpenVINO（CPU 推理）
+BACKENDS = ('torch', 'trt', 'openvino')
+
+# 各后端对应的 Ultralytics 导出格式
+_EXPORT_FORMATS = {'trt': 'engine', 'openvino': 'openvino'}
+
+# 导出的引擎使用动态批量，一次最多能推理这么多张图片（成批检测和摄像头攒批都在这个范围内）
+MAX_BATCH = 16
+
+# 内置进 TensorRT 引擎的 NMS 参数：信心阈值故意设得很低，只去掉几乎不可能是目标的框，
+# 真正的信心阈值（--confidence）在推理时再筛选，调低 --confidence 也不用重新导出引擎
+NMS_CONF = 0.05
+NMS_IOU = 0.7  # 和 Ultralytics 推理时的默认值一样
+NMS_MAX_DET = 300
+
+# TensorRT 引擎缓存文件夹（遵循 XDG_CACHE_HOME）
+ENGINE_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'face_rec')
+
+
+def _engine_cache_key(model_path: str, device: Optional[Union[str, int]], imgsz: int,
+                      half: bool, int8: bool, data: Optional[str] = None, nms: bool = False) -> str:
+    """
+    TensorRT 引擎缓存的键：模型文件（按真实路径、大小和修改时间，软链接指向同一个文件时不用重新构建）、
+    GPU 型号、CUDA 和 TensorRT 版本、输入尺寸、精度（INT8 还有校准数据）、最大批量和内置 NMS 的参数，
+    任何一个变了都要重新构建引擎
+    """
+    parts = []
+    real_path = os.path.realpath(model_path)
+    try:
+        stat = os.stat(real_path)
+        parts += [real_path, stat.st_size, int(stat.st_mtime)]
+    except OSError:
+        parts.append(real_path)
+    try:
+        import torch
+        gpu_id = str(device).replace('cuda:', '').replace('cuda', '0') if device not in (None, '', 'cpu') else '0'
+        parts += [torch.cuda.get_device_name(int(gpu_id) if gpu_id.isdigit() else 0), torch.version.cuda]
+    except Exception:
+        parts.append('unknown-gpu')
+    try:
+        import tensorrt
+        parts.append(tensorrt.__version__)
+    except Exception:
+        pass
+    parts += [imgsz, f'int8:{os.path.realpath(data or "")}' if int8 else ('fp16' if half else 'fp32'), MAX_BATCH]
+    if nms:
+        parts.append(f'nms:{NMS_CONF}:{NMS_IOU}:{NMS_MAX_DET}')
+    return hashlib.sha1('_'.join(map(str, parts)).encode()).hexdigest()[:12]
+
+
+def exported_model_path(model_path: str, backend: str, int8: bool = False, nms: bool = False,
+                        half: bool = False, imgsz: int = 640,
+                        device: Optional[Union[str, int]] = None, data: Optional[str] = None) -> str:
+    """
+    返回 .pt 模型导出为指定后端后的路径
+    TensorRT 引擎在 ENGINE_CACHE_DIR 里，文件名带上缓存键（见 _engine_cache_key）；
+    内置 NMS 的引擎另有名字，和普通引擎分开缓存
+    """
+    stem, _ = os.path.splitext(model_path)
+    if backend == 'trt':
+        key = _engine_cache_key(model_path, device, imgsz, half, int8, data, nms)
+        name = os.path.splitext(os.path.basename(os.path.realpath(model_path)))[0] + ('_nms' if nms else '')
+        return os.path.join(ENGINE_CACHE_DIR, f'{name}_{key}.engine')
+    if backend == 'openvino':
+        # OpenVINO 导出的是一个文件夹，INT8 版本另有名字
+        return stem + ('_int8_openvino_model' if int8 else '_openvino_model')
+    return model_path
+
+
+def load_yolo_model(model_path: str, backend: str = 'torch',
+                    device: Optional[Union[str, int]] = None, half: bool = False,
+                    int8: bool = False, imgsz: int = 640, data: Optional[str] = None, nms: bool = True):
+    """
+    按指定后端加载 YOLO 模型；需要时先导出并缓存推理引擎。
+
+    model_path: .pt 模型路径（如果直接传入 .engine 等导出文件，则原样加载）
+    backend: 'torch'、'trt' 或 'openvino'
+    half/int8: 导出引擎时使用的精度
+    data: INT8 校准数据集（Ultralytics 的数据集 yaml，图片要是人脸画面）；INT8 必须提供，
+          没有时改用 FP16（Ultralytics 默认的 COCO 数据集和人脸检测的画面差别太大，校准出来的精度不可靠）
+    nms: TensorRT 引擎里是否内置 NMS（这个版本的 Ultralytics 不支持时自动改为普通导出）；
+         加载内置 NMS 的引擎时 Ultralytics 会自动跳过自己的 NMS
+    """
+    nms = nms and backend == 'trt'
+    if int8 and not data and backend != 'torch':
+        print(" 提示：INT8 需要用人脸画面做校准（请提供校准数据集），这次改用 FP16 导出")
+        int8, half = False, True
+    from ultralytics import YOLO  # 延迟导入：只有真正用到 YOLO 时才加载
+
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}")
+    if backend == 'torch' or not model_path.endswith('.pt'):
+        return YOLO(model_path)
+
+    target = exported_model_path(model_path, backend, int8=int8, nms=nms, half=half, imgsz=imgsz,
+                                 device=device, data=data)
+    if not os.path.exists(target):
+        print(f"正在导出 {backend} 推理引擎：{target}（首次导出需要几分钟，请耐心等待）")
+        export_kwargs = {
+            'format': _EXPORT_FORMATS[backend],
+            'imgsz': imgsz,
+            'half': half,
+            'int8': int8,
+            'dynamic': True,
+            'batch': MAX_BATCH,
+        }
+        if backend == 'trt':
+            # TensorRT 引擎只能在 GPU 上构建
+            export_kwargs['device'] = 0 if device in (None, '', 'cpu') else device
+        if data:
+            export_kwargs['data'] = data
+        if nms:
+            export_kwargs.update(nms=True, conf=NMS_CONF, iou=NMS_IOU, max_det=NMS_MAX_DET)
+        try:
+            exported = YOLO(model_path).export(**export_kwargs)
+        except Exception as e:
+            if nms:
+                print(f" 导出内置 NMS 的推理引擎失败，改为普通导出：{e}")
+                return load_yolo_model(model_path, backend=backend, device=device, half=half,
+                                       int8=int8, imgsz=imgsz, data=data, nms=False)
+            print(f" 导出推理引擎失败，改用原始模型：{e}")
+            return YOLO(model_path)
+        # Ultralytics 总是导出到 .pt 旁边的 模型名.engine，把它移到缓存文件夹里
+        if backend == 'trt':
+            os.makedirs(ENGINE_CACHE_DIR, exist_ok=True)
+            # 模型文件可能是导出时才自动下载的，按下载好的文件重新算一次缓存键
+            target = exported_model_path(model_path, backend, int8=int8, nms=nms, half=half,
+                                         imgsz=imgsz, device=device, data=data)
+        if exported and os.path.abspath(str(exported)) != os.path.abspath(target) and os.path.exists(str(exported)):
+            shutil.move(str(exported), target)
+        if not os.path.exists(target):
+            print(f" 没有找到导出的推理引擎 {target}，改用原始模型")
+            return YOLO(model_path)
+
+    # OpenVINO 模型会在批量输入时自动切换到吞吐量模式，用异步推理队列并行处理多张图片
+    return YOLO(target, task='detect')
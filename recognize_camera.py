@@ -10,7 +10,7 @@
 import sys  # 系统工具
 import argparse  # 命令行参数解析器
 import os  # 读取环境变量以获取中文字体路径
-from face_recognition_yolo import YOLOFaceRecognizer  # 导入人脸识别器
+from model_export import BACKENDS  # YOLO 推理后端（torch / trt / openvino）
 
 
 def main():
@@ -35,6 +35,18 @@ def main():
   使用第2个摄像头（如果你有多个摄像头）：
   python recognize_camera.py --camera-id 1
   
+  使用 Jetson 的 CSI 摄像头：
+  python recognize_camera.py --csi
+  
+  USB 摄像头用 1080p、30 帧（默认 MJPG 格式）：
+  python recognize_camera.py --width 1920 --height 1080 --fps 30
+  
+  人基本不动时（比如门禁、考勤），画面没变化就不重复检测：
+  python recognize_camera.py --skip-similar
+  
+  在 GPU/Jetson 上使用 TensorRT 引擎（第一次运行时自动导出，需要几分钟）：
+  python recognize_camera.py --backend trt
+  
   使用自己的数据库和调整信心值：
   python recognize_camera.py --db my_faces.pkl --confidence 0.6
   
@@ -48,10 +60,28 @@ def main():
     # 参数1：选择使用哪个摄像头
     parser.add_argument('--camera-id', type=int, default=0, 
                        help='摄像头设备编号（默认：0表示第一个摄像头）')
+    parser.add_argument('--csi', action='store_true',
+                       help='Jetson CSI 摄像头（用 GStreamer 和硬件转换画面格式）')
+    parser.add_argument('--batch', type=int, default=1,
+                       help='攒够几帧画面一起处理（默认：1，隔几帧检测一次；大于 1 时每帧都检测，整批一次推理，GPU 上吞吐更高但延迟更大）')
+    parser.add_argument('--width', type=int, default=1280,
+                       help='USB 摄像头画面宽度（默认：1280）')
+    parser.add_argument('--height', type=int, default=720,
+                       help='USB 摄像头画面高度（默认：720）')
+    parser.add_argument('--fps', type=int, default=30,
+                       help='USB 摄像头帧率（默认：30）')
+    parser.add_argument('--fourcc', default='MJPG',
+                       help='USB 摄像头画面格式（默认：MJPG，摄像头自己压缩后再传，USB 带宽够用；'
+                            '摄像头不支持时可试 YUYV）')
+    parser.add_argument('--skip-similar', action='store_true',
+                       help='画面几乎没变（比如人坐着不动）时跳过检测，沿用上次的结果')
+    parser.add_argument('--skip-threshold', type=int, default=4,
+                       help='两帧画面哈希相差不到几位算几乎没变（默认：4，共 64 位）')
     
     # 参数2：人脸数据库文件的位置
     parser.add_argument('--db', default='face_database.pkl', 
-                       help='人脸数据库文件路径（默认：face_database.pkl）')
+                       help='人脸数据库文件路径（默认：face_database.pkl；.npy 格式启动最快，'
+                            '可用 python face_database.py convert face_database.npy 转换）')
     
     # 参数3：YOLO模型文件的位置
     parser.add_argument('--model', default='yolov8n.pt', 
@@ -59,7 +89,7 @@ def main():
     
     # 参数4：检测的信心阈值
     parser.add_argument('--confidence', '-c', type=float, default=0.5,
-                       help='检测信心阈值，范围0-1（默认：0.5表示50%把握）')
+                       help='检测信心阈值，范围0-1（默认：0.5表示50%%把握）')
 
     # 参数5：中文字体设置
     parser.add_argument('--font', help='中文字体文件路径（如 NotoSansCJK 或思源黑体）')
@@ -69,25 +99,51 @@ def main():
     parser.add_argument('--device', default=None,
                        help='推理设备：如 0/cuda:0 或 cpu（默认自动）')
     parser.add_argument('--no-half', action='store_true',
-                       help='禁用半精度FP16（Jetson如遇不兼容时使用）')
+                       help='禁用半精度FP16（默认在 CUDA GPU 上自动使用；Jetson如遇不兼容时使用）')
+    parser.add_argument('--db-device', default=None,
+                       help='把人脸数据库放到 GPU 上比对，如 cuda 或 cuda:0（默认：在 CPU 上比对）')
+    parser.add_argument('--db-dtype', default='fp16', choices=('fp16', 'int8'),
+                       help='--db-device 时 GPU 上数据库特征的数据类型（默认：fp16；int8 数据量减半）')
+    parser.add_argument('--no-channels-last', action='store_true',
+                       help='不使用 channels_last 内存布局（默认在 CUDA + FP16 时自动使用）')
+    parser.add_argument('--backend', default='torch', choices=BACKENDS,
+                       help='YOLO 推理后端（默认：torch；trt 第一次运行时把模型导出成 TensorRT 引擎，'
+                            '缓存在 ~/.cache/face_rec（按 GPU、CUDA/TensorRT 版本、尺寸和精度区分），之后直接加载）')
+    parser.add_argument('--repack-db', action='store_true',
+                       help='启动前把人脸数据库按最新格式重新保存一次（旧版数据库读取很慢时使用）')
+    parser.add_argument('--engine',
+                       help='直接使用已经导出好的 TensorRT 引擎文件（.engine），不再导出')
     
     # 解析用户输入的参数
     args = parser.parse_args()
+    if len(args.fourcc) != 4:
+        parser.error('--fourcc 必须是 4 个字符，如 MJPG 或 YUYV')
     
     # 【第1步】初始化人脸识别系统
     print("正在初始化人脸识别系统...")
     print("（第一次运行时可能需要下载AI模型，请耐心等待）")
+    # 识别器要加载 OpenCV、dlib 等很多工具包，解析完参数再导入（只看 --help 时不用等）
+    from face_recognition_yolo import YOLOFaceRecognizer, open_usb_camera  # 导入人脸识别器
+    
+    if args.repack_db:
+        from face_database import repack_database
+        repack_database(args.db)
     
     # 创建识别器对象，传入用户指定的参数
     # 支持中文字体路径通过环境变量或默认路径自动发现
     recognizer = YOLOFaceRecognizer(
         db_path=args.db,              # 使用哪个人脸数据库
-        yolo_model=args.model,        # 使用哪个YOLO模型
+        yolo_model=(args.engine or args.model),  # 使用哪个YOLO模型（给了引擎文件就直接用它）
         confidence=args.confidence,   # 检测的信心要求
         font_path=(args.font or os.getenv('CHINESE_FONT_PATH')),
         font_size=args.font_size,
         device=args.device,
-        use_half=(not args.no_half)
+        use_half=(False if args.no_half else None),  # 默认自动：只在 CUDA 上用 FP16
+        channels_last=(False if args.no_channels_last else None),
+        db_device=args.db_device,
+        db_dtype=args.db_dtype,
+        # 按 --backend 需要时先导出推理引擎（导出失败会自动改用 .pt 模型）
+        backend=('trt' if args.engine else args.backend)
     )
     
     # 【第2步】开始摄像头识别
@@ -95,9 +151,21 @@ def main():
     print("提示：摄像头启动后，把脸对准摄像头，程序会自动识别你是谁")
     print("      按 'q' 键可以随时退出程序\n")
     
+    # USB 摄像头先按指定的格式、分辨率和帧率打开（CSI 摄像头由 GStreamer 管道设置）
+    cap = None
+    if not args.csi:
+        cap = open_usb_camera(args.camera_id, width=args.width, height=args.height,
+                              fps=args.fps, fourcc=args.fourcc)
+        if cap is None:
+            print(f" 错误：无法打开摄像头 {args.camera_id}")
+            return
+    
     # 调用识别器的摄像头处理函数
     # 这个函数会一直运行，直到你按'q'键退出
-    recognizer.process_camera(camera_id=args.camera_id)
+    recognizer.process_camera(camera_id=args.camera_id, csi=args.csi,
+                              batch_size=args.batch,
+                              skip_similar=args.skip_similar, skip_threshold=args.skip_threshold,
+                              cap=cap)
 
 
 # 程序启动代码
@@ -10,18 +10,214 @@
 import sys  # 系统工具
 import argparse  # 命令行参数解析器
 import os  # 读取环境变量以获取中文字体路径
-from face_recognition_yolo import YOLOFaceRecognizer  # 导入人脸识别器
+import stat  # 检查套接字目录和密钥文件的权限
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener  # 常驻识别服务和命令行之间的通信
+from model_export import BACKENDS  # YOLO 推理后端（torch / trt / openvino）
 
+# 常驻识别服务（--server）的套接字和密钥放在只有自己能进的目录里：
+# 优先用 $XDG_RUNTIME_DIR（登录时系统建好的私有目录），没有时在 /tmp 下建一个 0700 的目录
+# 连接时双方还要用密钥互相验证，别的用户冒充服务也没法让客户端接收它发来的数据
+if hasattr(os, 'getuid'):
+    SOCKET_DIR = (os.path.join(os.environ['XDG_RUNTIME_DIR'], 'face_rec') if os.getenv('XDG_RUNTIME_DIR')
+                  else f'/tmp/face_recognition_{os.getuid()}')
+    SOCKET_PATH = os.path.join(SOCKET_DIR, 'server.sock')
+    AUTHKEY_PATH = os.path.join(SOCKET_DIR, 'server.key')
+else:
+    SOCKET_DIR = SOCKET_PATH = AUTHKEY_PATH = None
 
-def main():
+
+def is_private(path, kind):
+    """path 是自己的、别人没有任何权限、类型是 kind（stat.S_ISDIR 等；不跟随符号链接）时返回 True"""
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return False
+    return (kind(info.st_mode) and info.st_uid == os.getuid()
+            and not info.st_mode & (stat.S_IRWXG | stat.S_IRWXO))
+
+
+def read_authkey(authkey_path):
+    """读取常驻服务的密钥；文件不是自己的或者别人也能读写时不信任它，返回 None"""
+    if not is_private(os.path.dirname(authkey_path), stat.S_ISDIR) or not is_private(authkey_path, stat.S_ISREG):
+        return None
+    with open(authkey_path, 'rb') as f:
+        return f.read()
+
+
+def recognizer_options(args):
     """
-    【主函数】
-    这是程序的入口，负责：
-    1. 接收用户输入的参数（比如要识别哪张照片）
-    2. 启动人脸识别系统
-    3. 识别照片中的人脸并显示结果
+    决定识别结果的参数（数据库、模型、信心值、设备等），路径都换成绝对路径
+    常驻服务只在这些参数和它启动时完全一样时才替客户端识别
     """
-    
+    def full_path(path):
+        return os.path.abspath(path) if path and os.path.exists(path) else path
+    return {
+        'db': full_path(args.db),
+        'model': full_path(args.engine or args.model),
+        'backend': 'trt' if args.engine else args.backend,
+        'confidence': args.confidence,
+        'device': args.device,
+        'no_half': args.no_half,
+        'no_channels_last': args.no_channels_last,
+        'db_device': args.db_device,
+        'db_dtype': args.db_dtype,
+        'font': full_path(args.font or os.getenv('CHINESE_FONT_PATH')),
+        'font_size': args.font_size,
+    }
+
+
+def ask_server(socket_path, authkey_path, request):
+    """
+    【把识别请求交给常驻服务】
+    连得上 --server 启动的常驻服务就把请求发过去，返回服务的回复；
+    连不上（服务没启动、不支持 UNIX 套接字）时返回 None，由调用方自己加载模型识别
+    服务在处理途中退出（连接断开）、套接字或密钥不是自己的、密钥验证不通过时同样返回 None
+    """
+    if not socket_path or not is_private(socket_path, stat.S_ISSOCK):
+        return None
+    try:
+        authkey = read_authkey(authkey_path)
+        if not authkey:
+            return None
+        with Client(socket_path, 'AF_UNIX', authkey=authkey) as conn:
+            conn.send(request)
+            return conn.recv()
+    except (OSError, EOFError, AuthenticationError):
+        return None
+
+
+def database_signature(db_path):
+    """数据库文件（以及追加日志、.npy 格式的名字和长度文件）的修改时间和大小，有变化说明数据库被改过"""
+    import face_database
+    paths = (db_path, face_database.wal_path_for(db_path),
+             face_database.names_path_for(db_path), face_database.norms_path_for(db_path))
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            signature.append(None)
+        else:
+            signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def handle_request(recognizer, request, server_options):
+    """
+    【常驻服务处理一次识别请求】
+    request 里的路径都是客户端那边的绝对路径；
+    单张图片需要显示时，把画好框的图片发回去，由客户端弹窗显示（服务在后台，没有窗口）
+    客户端的识别参数和服务启动时的不一样时不识别，回复哪些参数不同，由客户端自己加载模型
+    """
+    from face_recognition_yolo import cv2, expand_image_paths
+    options = request.get('options') or {}
+    mismatch = sorted(key for key in set(options) | set(server_options)
+                      if options.get(key) != server_options.get(key))
+    if mismatch:
+        return {'mismatch': mismatch}
+    image_paths = expand_image_paths(request['images'])
+    if len(image_paths) > 1:
+        return {'results': recognizer.process_images(image_paths, output_dir=request['output'])}
+    frame = cv2.imread(image_paths[0])
+    if frame is None:
+        return {'error': f"无法读取图片 {image_paths[0]}"}
+    results = recognizer.recognize_faces_in_frame(frame)
+    output_frame = recognizer.draw_results(frame, results)
+    if request['output']:
+        cv2.imwrite(request['output'], output_frame)
+    return {'results': {image_paths[0]: results},
+            'frame': output_frame if request['show'] else None}
+
+
+def serve(recognizer, socket_path, authkey_path, options):
+    """
+    【常驻识别服务】
+    模型只加载一次，一直等着别的 recognize_image.py 发来图片路径，
+    省掉每次运行都要花的模型加载和 CUDA 初始化时间（一般要好几秒）
+    options: 服务启动时的识别参数（见 recognizer_options），参数不同的请求会被拒绝
+    服务运行期间用 face_database.py 添加、导入了人脸时，下一个请求前自动重新加载数据库
+    每次启动都生成新的随机密钥（只有自己能读），客户端要用它通过验证才能发请求
+    """
+    socket_dir = os.path.dirname(socket_path)
+    # 先把权限掩码设成只有自己能访问，再建目录、写密钥、绑定套接字，中间没有别人能连进来的空档
+    old_umask = os.umask(0o077)
+    try:
+        os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+        if not is_private(socket_dir, stat.S_ISDIR):
+            raise RuntimeError(f"{socket_dir} 不是自己的私有目录（可能被别的用户抢先建好），拒绝启动识别服务")
+        for path in (socket_path, authkey_path):
+            if os.path.lexists(path):
+                os.remove(path)  # 上次异常退出留下的套接字和密钥文件
+        authkey = os.urandom(32)
+        fd = os.open(authkey_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(authkey)
+        listener = Listener(socket_path, 'AF_UNIX', authkey=authkey)
+    finally:
+        os.umask(old_umask)
+    print(f" 识别服务已启动：{socket_path}（按 Ctrl+C 停止）")
+    db_signature = database_signature(recognizer.db_path)
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                continue  # 没有密钥的连接（或者连到一半就断开），不理它
+            with conn:
+                try:
+                    request = conn.recv()
+                except (OSError, EOFError):
+                    continue
+                try:
+                    signature = database_signature(recognizer.db_path)
+                    if signature != db_signature:
+                        recognizer.reload_database()
+                        db_signature = database_signature(recognizer.db_path)
+                    reply = handle_request(recognizer, request, options)
+                except Exception as e:
+                    reply = {'error': str(e)}
+                try:
+                    conn.send(reply)
+                except (OSError, EOFError):
+                    continue  # 客户端等不及先断开了（比如按了 Ctrl+C），接着等下一个请求
+    except KeyboardInterrupt:
+        print("\n识别服务已停止")
+    finally:
+        listener.close()
+        for path in (socket_path, authkey_path):
+            if os.path.lexists(path):
+                os.remove(path)
+
+
+def print_reply(reply, show):
+    """打印常驻服务发回的识别结果，需要时显示画好框的图片"""
+    if 'error' in reply:
+        print(f" 错误：{reply['error']}")
+        return
+    for image_path, results in reply['results'].items():
+        names = '、'.join(f"{name}（{conf:.2f}）" for name, conf, _ in results) or '没有检测到人脸'
+        print(f" {image_path}：{names}")
+    if show and reply.get('frame') is not None:
+        import cv2
+        cv2.imshow('人脸识别结果', reply['frame'])
+        print("按任意键关闭窗口...")
+        cv2.waitKey(0)
+        cv2.destroyAllWindows()
+
+
+# 只给了一张图片、没有其他参数时（最常见的用法）直接用这些默认值，不用构建命令行解析器
+# （和 build_parser 里各参数的默认值保持一致）
+DEFAULT_ARGS = dict(
+    output=None, db='face_database.pkl', model='yolov8n.pt', confidence=0.5, no_show=False,
+    device=None, no_half=False, db_device=None, db_dtype='fp16', no_channels_last=False,
+    backend='torch', repack_db=False, engine=None, font=None, font_size=20,
+    server=False, local=False,
+)
+
+
+def build_parser():
+    """创建命令行参数解析器（见 main）"""
     # 创建命令行参数解析器
     # 这个工具可以理解用户在命令行输入的各种选项
     parser = argparse.ArgumentParser(
@@ -35,8 +231,19 @@ def main():
   识别照片并保存结果：
   python recognize_image.py 照片.jpg --output 结果.jpg
   
+  一次识别多张照片（模型只加载一次），结果保存到文件夹：
+  python recognize_image.py 照片1.jpg 照片2.jpg "相册/*.jpg" --output 结果
+  
+  在 GPU/Jetson 上使用 TensorRT 引擎（第一次运行时自动导出，需要几分钟）：
+  python recognize_image.py 照片.jpg --backend trt
+  
   使用自己的数据库和调整信心值：
   python recognize_image.py 照片.jpg --db my_faces.pkl --confidence 0.6
+  
+  经常要识别单张照片时，先在后台启动常驻识别服务（模型只加载一次），
+  之后的 recognize_image.py 会自动交给它处理，不用每次重新加载模型：
+  python recognize_image.py --server &
+  python recognize_image.py 照片.jpg
         """
     )
     
@@ -44,15 +251,16 @@ def main():
     
     # 必需参数：要识别的图片文件
     # 这是唯一必须提供的参数，其他都是可选的
-    parser.add_argument('image', help='要识别的图片文件路径（必需）')
+    parser.add_argument('image', nargs='*', help='要识别的图片文件路径（必需，可以给多张或用通配符）')
     
     # 可选参数1：结果图片保存路径
     parser.add_argument('--output', '-o', 
-                       help='保存识别结果的图片路径（可选）')
+                       help='保存识别结果的图片路径（可选；多张图片时是保存结果的文件夹）')
     
     # 可选参数2：人脸数据库文件的位置
     parser.add_argument('--db', default='face_database.pkl', 
-                       help='人脸数据库文件路径（默认：face_database.pkl）')
+                       help='人脸数据库文件路径（默认：face_database.pkl；.npy 格式启动最快，'
+                            '可用 python face_database.py convert face_database.npy 转换）')
     
     # 可选参数3：YOLO模型文件的位置
     parser.add_argument('--model', default='yolov8n.pt', 
@@ -60,7 +268,7 @@ def main():
     
     # 可选参数4：检测的信心阈值
     parser.add_argument('--confidence', '-c', type=float, default=0.5, 
-                       help='检测信心阈值，范围0-1（默认：0.5表示50%把握）')
+                       help='检测信心阈值，范围0-1（默认：0.5表示50%%把握）')
     
     # 可选参数5：是否显示结果窗口
     parser.add_argument('--no-show', action='store_true', 
@@ -70,33 +278,108 @@ def main():
     parser.add_argument('--device', default=None,
                        help='推理设备：如 0/cuda:0 或 cpu（默认自动）')
     parser.add_argument('--no-half', action='store_true',
-                       help='禁用半精度FP16（Jetson如遇不兼容时使用）')
+                       help='禁用半精度FP16（默认在 CUDA GPU 上自动使用；Jetson如遇不兼容时使用）')
+    parser.add_argument('--db-device', default=None,
+                       help='把人脸数据库放到 GPU 上比对，如 cuda 或 cuda:0（默认：在 CPU 上比对）')
+    parser.add_argument('--db-dtype', default='fp16', choices=('fp16', 'int8'),
+                       help='--db-device 时 GPU 上数据库特征的数据类型（默认：fp16；int8 数据量减半）')
+    parser.add_argument('--no-channels-last', action='store_true',
+                       help='不使用 channels_last 内存布局（默认在 CUDA + FP16 时自动使用）')
+    parser.add_argument('--backend', default='torch', choices=BACKENDS,
+                       help='YOLO 推理后端（默认：torch；trt 第一次运行时把模型导出成 TensorRT 引擎，'
+                            '缓存在 ~/.cache/face_rec（按 GPU、CUDA/TensorRT 版本、尺寸和精度区分），之后直接加载）')
+    parser.add_argument('--repack-db', action='store_true',
+                       help='启动前把人脸数据库按最新格式重新保存一次（旧版数据库读取很慢时使用）')
+    parser.add_argument('--engine',
+                       help='直接使用已经导出好的 TensorRT 引擎文件（.engine），不再导出')
 
     # 可选参数6：中文字体路径与字号
     parser.add_argument('--font', help='中文字体文件路径（如 NotoSansCJK 或思源黑体）')
     parser.add_argument('--font-size', type=int, default=20, help='标签文字字号（默认：20）')
+
+    # 可选参数7：常驻识别服务
+    parser.add_argument('--server', action='store_true',
+                       help='启动常驻识别服务：模型只加载一次，之后运行的 recognize_image.py 自动交给它识别')
+    parser.add_argument('--local', action='store_true',
+                       help='不使用常驻识别服务，在本进程里加载模型识别')
+    return parser
+
+
+def main():
+    """
+    【主函数】
+    这是程序的入口，负责：
+    1. 接收用户输入的参数（比如要识别哪张照片）
+    2. 启动人脸识别系统
+    3. 识别照片中的人脸并显示结果
+    """
     
-    # 解析用户输入的参数
-    args = parser.parse_args()
+    if len(sys.argv) == 2 and not sys.argv[1].startswith('-'):
+        # 快速路径：python recognize_image.py 照片.jpg
+        args = argparse.Namespace(image=[sys.argv[1]], **DEFAULT_ARGS)
+    else:
+        parser = build_parser()
+        # 解析用户输入的参数
+        args = parser.parse_args()
+        if args.server and not SOCKET_PATH:
+            parser.error('当前系统不支持 UNIX 套接字，不能使用 --server')
+        if not args.server and not args.image:
+            parser.error('请给出要识别的图片文件路径')
+
+    # 常驻识别服务已经在运行时，直接把图片交给它
+    # （数据库、模型等参数和服务启动时不一样时服务会拒绝，这里改为自己加载；要重新整理数据库时也不用服务）
+    if not args.server and not args.local and not args.repack_db:
+        reply = ask_server(SOCKET_PATH, AUTHKEY_PATH, {
+            'images': [os.path.abspath(p) for p in args.image],
+            'output': os.path.abspath(args.output) if args.output else None,
+            'show': not args.no_show,
+            'options': recognizer_options(args),
+        })
+        if reply is not None and 'mismatch' in reply:
+            print(f" 常驻识别服务的参数和这次不同（{'、'.join(reply['mismatch'])}），在本进程里识别")
+        elif reply is not None:
+            print_reply(reply, show=not args.no_show)
+            return
     
     # 【第1步】初始化人脸识别系统
     print("正在初始化人脸识别系统...")
     print("（第一次运行时可能需要下载AI模型，请耐心等待）")
+    # 识别器要加载 OpenCV、dlib 等很多工具包，解析完参数再导入（只看 --help 时不用等）
+    from face_recognition_yolo import YOLOFaceRecognizer, expand_image_paths  # 导入人脸识别器
+    
+    if args.repack_db:
+        from face_database import repack_database
+        repack_database(args.db)
     
     # 创建识别器对象，传入用户指定的参数
     # 支持中文字体路径通过环境变量或默认路径自动发现
     recognizer = YOLOFaceRecognizer(
         db_path=args.db,              # 使用哪个人脸数据库
-        yolo_model=args.model,        # 使用哪个YOLO模型
+        yolo_model=(args.engine or args.model),  # 使用哪个YOLO模型（给了引擎文件就直接用它）
         confidence=args.confidence,   # 检测的信心要求
         font_path=(args.font or os.getenv('CHINESE_FONT_PATH')),
         font_size=args.font_size,
         device=args.device,
-        use_half=(not args.no_half)
+        use_half=(False if args.no_half else None),  # 默认自动：只在 CUDA 上用 FP16
+        channels_last=(False if args.no_channels_last else None),
+        db_device=args.db_device,
+        db_dtype=args.db_dtype,
+        # 按 --backend 需要时先导出推理引擎（导出失败会自动改用 .pt 模型）
+        backend=('trt' if args.engine else args.backend)
     )
+
+    if args.server:
+        serve(recognizer, SOCKET_PATH, AUTHKEY_PATH, recognizer_options(args))
+        return
     
     # 【第2步】处理图片
-    print(f"\n正在处理图片：{args.image}")
+    image_paths = expand_image_paths(args.image)
+    if len(image_paths) > 1:
+        # 多张图片一起处理：识别器只创建一次，图片成批送进 YOLO
+        print(f"\n正在处理 {len(image_paths)} 张图片...")
+        recognizer.process_images(image_paths, output_dir=args.output)
+        return
+    print(f"\n正在处理图片：{image_paths[0]}")
     print("程序会：")
     print("  1. 在图片中找到所有人脸")
     print("  2. 识别每张脸是谁")
@@ -104,7 +387,7 @@ def main():
     
     # 调用识别器的图片处理函数
     recognizer.process_image(
-        args.image,                   # 输入图片路径
+        image_paths[0],               # 输入图片路径
         output_path=args.output,      # 输出图片路径（如果指定了的话）
         show=not args.no_show         # 是否显示结果（如果没有--no-show就显示）
     )
@@ -1,9 +1,10 @@
 """
 继电器控制服务（Jetson.GPIO）
 - 默认使用 BOARD 编号，控制引脚为 18
-- 提供 on/off/toggle/cleanup 接口
+- 提供 on/off/toggle/pulse/cleanup 接口
 - 若当前环境无 Jetson.GPIO，则方法为安全空操作，便于在开发机运行 GUI
 """
+import threading
 from typing import Optional
 
 try:
@@ -19,7 +20,10 @@ class RelayControl:
         self.pin: int = pin
         self.mode: str = mode.upper()
         self._enabled: bool = False
-        self._state_on: bool = False
+        self._state_on: bool = False  # 最后一次写到引脚上的电平（高电平为 True）
+        self._pulse_timer: Optional[threading.Timer] = None  # pulse() 到时自动关闭的定时器
+        # 状态判断和写引脚要一起完成：pulse() 的定时器在另一个线程里关继电器，不能和界面线程交错
+        self._lock = threading.RLock()
         self._gpio = _GPIO
 
         if self._gpio is None:
@@ -36,36 +40,72 @@ class RelayControl:
         self._enabled = True
 
     def on(self) -> None:
-        """打开继电器（输出高电平，按题示例）。"""
-        if not self._enabled:
-            return
-        self._gpio.output(self.pin, self._gpio.HIGH)
-        self._state_on = True
+        """打开继电器（输出高电平，按题示例）；已经是打开状态时不再重复写引脚。"""
+        with self._lock:
+            self._cancel_pulse()
+            self._write(True)
 
     def off(self) -> None:
-        """关闭继电器（输出低电平）。"""
-        if not self._enabled:
-            return
-        self._gpio.output(self.pin, self._gpio.LOW)
-        self._state_on = False
+        """关闭继电器（输出低电平）；已经是关闭状态时不再重复写引脚。"""
+        with self._lock:
+            self._cancel_pulse()
+            self._write(False)
 
     def toggle(self) -> None:
         """切换继电器状态。"""
-        if self._state_on:
-            self.off()
-        else:
+        with self._lock:
+            if self._state_on:
+                self.off()
+            else:
+                self.on()
+
+    def _write(self, state_on: bool) -> None:
+        # 调用方持有 self._lock
+        if not self._enabled or self._state_on == state_on:
+            return
+        self._gpio.output(self.pin, self._gpio.HIGH if state_on else self._gpio.LOW)
+        self._state_on = state_on
+
+    def pulse(self, duration_ms: int) -> None:
+        """
+        打开继电器，duration_ms 毫秒后自动关闭（由后台定时器关闭，调用方不用等待）。
+        脉冲还没结束时再次调用会重新计时；期间手动 on()/off() 会取消自动关闭。
+        """
+        with self._lock:
             self.on()
+            if not self._enabled:
+                return
+            timer = threading.Timer(duration_ms / 1000.0, self._end_pulse)
+            timer.daemon = True
+            self._pulse_timer = timer
+            timer.start()
+
+    def _end_pulse(self) -> None:
+        # 在定时器线程里运行；定时器到点前刚好被 on()/off()/cleanup() 取消或被新的脉冲替换时不再关闭
+        with self._lock:
+            if self._pulse_timer is not threading.current_thread():
+                return
+            self._pulse_timer = None
+            self._write(False)
+
+    def _cancel_pulse(self) -> None:
+        # 调用方持有 self._lock
+        timer, self._pulse_timer = self._pulse_timer, None
+        if timer is not None:
+            timer.cancel()
 
     def cleanup(self) -> None:
         """释放 GPIO 资源。"""
-        if not self._enabled:
-            return
-        try:
-            # 清理所有已使用的通道，最安全
-            self._gpio.cleanup()
-        finally:
-            self._enabled = False
-            self._state_on = False
+        with self._lock:
+            self._cancel_pulse()
+            if not self._enabled:
+                return
+            try:
+                # 只清理自己用到的这个引脚：不会动到其他程序使用的引脚，也不用逐个遍历所有通道
+                self._gpio.cleanup(self.pin)
+            finally:
+                self._enabled = False
+                self._state_on = False
 
     def is_on(self) -> bool:
         """返回当前记录的状态（仅在本进程内有效）。"""
@@ -24,7 +24,9 @@ class RelayGUI:
 
         self.relay: RelayControl = RelayControl(pin=pin, mode=mode)
 
-        self.status_var: tk.StringVar = tk.StringVar()
+        self.status_label: Optional[tk.Label] = None
+        # 上一次设置到按钮上的状态（NORMAL/DISABLED），没变化时不再逐个重设
+        self._last_state: Optional[str] = None
         self.btn_on: Optional[tk.Button] = None
         self.btn_off: Optional[tk.Button] = None
         self.btn_toggle: Optional[tk.Button] = None
@@ -39,12 +41,12 @@ class RelayGUI:
         container = tk.Frame(self.root, padx=12, pady=12)
         container.pack(fill=tk.BOTH, expand=True)
 
-        status_label = tk.Label(
+        # 直接保存标签控件并用 configure 更新文字，不用 StringVar（省掉每次 set 触发的 trace 回调）
+        self.status_label = tk.Label(
             container,
-            textvariable=self.status_var,
             font=("Arial", 14, "bold"),
         )
-        status_label.pack(pady=(0, 8))
+        self.status_label.pack(pady=(0, 8))
 
         btn_frame = tk.Frame(container)
         btn_frame.pack(fill=tk.X)
@@ -128,11 +130,17 @@ class RelayGUI:
     def _refresh_controls(self) -> None:
         available = self.relay.available()
         if not available:
-            self.status_var.set("继电器不可用（Jetson.GPIO 未安装）")
+            text = "继电器不可用（Jetson.GPIO 未安装）"
         else:
-            self.status_var.set("继电器状态：开" if self.relay.is_on() else "继电器状态：关")
+            text = "继电器状态：开" if self.relay.is_on() else "继电器状态：关"
+        # 文字没变就不碰标签，避免 Nano 上不必要的重新布局
+        if self.status_label is not None and self.status_label.cget("text") != text:
+            self.status_label.configure(text=text)
 
         state = tk.NORMAL if available else tk.DISABLED
+        if self._last_state == state:
+            return
+        self._last_state = state
         if self.btn_on is not None:
             self.btn_on.config(state=state)
         if self.btn_off is not None: